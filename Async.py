@@ -0,0 +1,119 @@
+import asyncio;
+import threading;
+from CAS.Errors import UserError, EvaluationError;
+from CAS.Cache import LRUCache;
+
+# asyncio front end. Requests for the same tree that arrive within max_delay of the first one are gathered into a batch
+# of at most max_batch_size, evaluated in one call on an executor (a thread pool by default) so the event loop never
+# blocks, and every request gets its own result or exception. At most max_pending requests are in flight; further
+# callers wait for a slot. Trees are grouped by structure and symbols (see ParseTree.get_structure), so the copies
+# Parser.parse returns for one expression are batched together and compiled once.
+
+
+class Batch():
+
+    """ The pending requests for one tree structure """
+
+    __slots__ = ("key", "tree", "requests", "timer");
+
+    def __init__(self, key, tree):
+        self.key = key;
+        self.tree = tree; # the tree of the first request
+        self.requests = []; # (substitutions, future)
+        self.timer = None;
+
+
+class AsyncEvaluator():
+
+    """ Evaluates trees in floats (like compile_float) from asyncio code, in micro-batches run off the event loop """
+
+    def __init__(self, max_batch_size=256, max_delay=0.001, max_pending=10000, executor=None, cache_size=256):
+        if not isinstance(max_batch_size, int) or max_batch_size < 1:
+            raise UserError("The maximum batch size must be a positive integer. Actual value: {}".format(max_batch_size));
+        if not isinstance(max_pending, int) or max_pending < 1:
+            raise UserError("The maximum number of pending requests must be a positive integer. Actual value: {}".format(max_pending));
+        if max_delay < 0:
+            raise UserError("The maximum delay must not be negative. Actual value: {}".format(max_delay));
+        self.max_batch_size, self.max_delay, self.executor = max_batch_size, max_delay, executor;
+        self.slots = asyncio.Semaphore(max_pending);
+        self.batches = {}; # (structure, symbols): Batch
+        self.running = set(); # tasks evaluating batches
+        self.functions = LRUCache(cache_size); # (structure, symbols): compiled function
+        self.lock = threading.Lock(); # the executor may evaluate batches in several threads
+        self.batch_count = self.request_count = 0;
+
+    async def __aenter__(self):
+        return self;
+
+    async def __aexit__(self, *exception):
+        await self.drain();
+        return False;
+
+    async def evaluate(self, tree, **substitutions):
+        """ evaluate tree at substitutions, batched with other concurrent requests for the same tree """
+        async with self.slots:
+            future = asyncio.get_running_loop().create_future();
+            key = (tree.get_structure(), tree.get_ordered_symbols());
+            batch = self.batches.get(key);
+            if batch is None:
+                batch = self.batches[key] = Batch(key, tree);
+                batch.timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush, batch);
+            batch.requests.append((substitutions, future));
+            if len(batch.requests) >= self.max_batch_size:
+                self.flush(batch);
+            return await future;
+
+    def flush(self, batch):
+        """ start evaluating a batch, unless it has already been started """
+        if self.batches.get(batch.key) is not batch:
+            return;
+        del self.batches[batch.key];
+        batch.timer.cancel();
+        task = asyncio.get_running_loop().create_task(self.run(batch));
+        self.running.add(task);
+        task.add_done_callback(self.running.discard);
+
+    async def run(self, batch):
+        """ evaluate a batch on the executor and resolve the futures of its requests """
+        requests = [(substitutions, future) for substitutions, future in batch.requests if not future.cancelled()];
+        if not requests:
+            return;
+        self.batch_count += 1;
+        self.request_count += len(requests);
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.evaluate_batch, batch.key, batch.tree, [substitutions for substitutions, future in requests]);
+        except Exception as error: # e.g. the tree cannot be compiled: every request fails with the same error
+            results = [(None, error)] * len(requests);
+        for (substitutions, future), (value, error) in zip(requests, results):
+            if future.done():
+                continue;
+            if error is None:
+                future.set_result(value);
+            else:
+                future.set_exception(error);
+
+    def evaluate_batch(self, key, tree, rows):
+        """ evaluate every row, isolating errors. runs on the executor. returns a list of (value, exception) """
+        symbols = key[1];
+        with self.lock:
+            function = self.functions.get(key);
+        if function is None:
+            function = tree.compile_float();
+            with self.lock:
+                self.functions.put(key, function);
+        results = [];
+        for substitutions in rows:
+            try:
+                results.append((float(function(*[substitutions[symbol] for symbol in symbols])), None));
+            except KeyError as error:
+                results.append((None, UserError("No value was given for the symbol {}".format(error))));
+            except (EvaluationError, TypeError) as error:
+                results.append((None, error));
+        return results;
+
+    async def drain(self):
+        """ start every pending batch now and wait until all batches are evaluated """
+        for batch in list(self.batches.values()):
+            self.flush(batch);
+        while self.running:
+            await asyncio.gather(*self.running, return_exceptions=True);
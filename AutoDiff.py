@@ -0,0 +1,186 @@
+import math;
+from CAS.Errors import UserError, EvaluationError;
+from CAS.data import OPERATIONS, KNOWN_FUNCTIONS;
+
+# Forward-mode automatic differentiation. Every node carries its value and a list with one partial derivative per symbol.
+# A partial that is None is known to be zero, so constant subtrees cost nothing extra.
+# The same code handles scalars (library = math) and numpy arrays (library = numpy).
+
+# partial derivatives of the known functions with respect to each of their arguments
+DERIVATIVES = {
+    "sin": (lambda library, x: library.cos(x),),
+    "cos": (lambda library, x: -library.sin(x),),
+    "tan": (lambda library, x: 1 / library.cos(x) ** 2,),
+    "asin": (lambda library, x: 1 / library.sqrt(1 - x * x),),
+    "acos": (lambda library, x: -1 / library.sqrt(1 - x * x),),
+    "atan": (lambda library, x: 1 / (1 + x * x),),
+    "sinh": (lambda library, x: library.cosh(x),),
+    "cosh": (lambda library, x: library.sinh(x),),
+    "tanh": (lambda library, x: 1 - library.tanh(x) ** 2,),
+    "exp": (lambda library, x: library.exp(x),),
+    "log": (
+        lambda library, x, base=math.e: 1 / (x * library.log(base)),
+        lambda library, x, base: -library.log(x) / (base * library.log(base) ** 2)
+    ),
+    "log10": (lambda library, x: 1 / (x * math.log(10)),),
+    "log2": (lambda library, x: 1 / (x * math.log(2)),),
+    "sqrt": (lambda library, x: 1 / (2 * library.sqrt(x)),),
+    "abs": (lambda library, x: library.copysign(1.0, x) * (x != 0),), # the sign of x, 0 at 0
+    "floor": (lambda library, x: 0 * x,),
+    "ceil": (lambda library, x: 0 * x,)
+};
+
+
+def register_derivative(derivatives, function, *partials):
+    """ register the partial derivatives of a function in derivatives (a Parser's registry, keyed by the function itself), one callable per argument, each taking the same arguments as the function """
+    if not callable(function):
+        raise UserError("Derivatives can only be registered for callables. Actual value: {}".format(function));
+    for partial in partials:
+        if not callable(partial):
+            raise UserError("Partial derivatives must be callable. Actual value of first illegal partial: {}".format(partial));
+    derivatives[function] = partials;
+
+
+def get_partials(function, library, vectorize=None, derivatives=None):
+    """ the partial derivatives of a function, as callables taking its arguments. derivatives holds the registered ones. None if none are known """
+    try:
+        if derivatives and function in derivatives:
+            partials = derivatives[function];
+            return partials if vectorize is None else tuple(vectorize(partial) for partial in partials);
+        name = KNOWN_FUNCTIONS.get(function);
+    except TypeError: # unhashable callable
+        return None;
+    if name not in DERIVATIVES:
+        return None;
+    return tuple((lambda *arguments, rule=rule: rule(library, *arguments)) for rule in DERIVATIVES[name]);
+
+
+def logarithm(library, x):
+    """ library.log(x), but nan rather than an error where x is not positive """
+    if library is math:
+        return math.log(x) if x > 0 else math.nan;
+    return library.log(x);
+
+
+def power_partial(library, a, b):
+    """ b * a ** (b - 1), the partial of a ** b with respect to a. 0 where b is 0, and inf rather than an error where a is 0 and b < 1 """
+    if library is math:
+        if b == 0:
+            return 0.0;
+        try:
+            return b * a ** (b - 1);
+        except ZeroDivisionError:
+            return math.copysign(math.inf, b);
+    return library.where(b == 0, 0.0, b * a ** (b - 1));
+
+
+def add(a, b):
+    """ sum of two partials that may be None (zero) """
+    if a is None: return b;
+    if b is None: return a;
+    return a + b;
+
+
+def scale(a, factor):
+    """ product of a partial that may be None (zero) and a factor """
+    return None if a is None else a * factor;
+
+
+def differentiate_operation(name, library, values, gradients):
+    """ value and gradient of one of OPERATIONS applied to values with gradients """
+    if name == "~":
+        return -values[0], [None if g is None else -g for g in gradients[0]];
+    (a, b), (ga, gb) = values, gradients;
+    if name == "+":
+        return a + b, [add(x, y) for x, y in zip(ga, gb)];
+    elif name == "-":
+        return a - b, [add(x, None if y is None else -y) for x, y in zip(ga, gb)];
+    elif name == "*":
+        return a * b, [add(scale(x, b), scale(y, a)) for x, y in zip(ga, gb)];
+    elif name == "/":
+        value = a / b;
+        return value, [scale(add(x, scale(y, -value)), 1 / b) for x, y in zip(ga, gb)];
+    elif name == "%":
+        quotient = library.floor(a / b);
+        return a % b, [add(x, scale(y, -quotient)) for x, y in zip(ga, gb)];
+    elif name == "^":
+        value = a ** b;
+        if isinstance(value, complex):
+            raise ValueError("a negative number cannot be raised to a fractional power");
+        base_factor = power_partial(library, a, b) if any(x is not None for x in ga) else None;
+        # the log is only needed when the exponent varies. it is only defined for positive bases: elsewhere the partials with
+        # respect to the exponent are nan, while the value and the partials with respect to the base are still defined
+        exponent_factor = value * logarithm(library, a) if any(y is not None for y in gb) else None;
+        return value, [add(scale(x, base_factor), scale(y, exponent_factor)) for x, y in zip(ga, gb)];
+    raise UserError("Unknown operation '{}'".format(name));
+
+
+def propagate(ordered_nodes, substitutions, symbols, library, number, evaluate_function, get_function_partials):
+    """ forward-mode pass over the nodes of a tree (children before parents, root last). returns the value and gradient of the root """
+    values, gradients, index = {}, {}, {symbol: i for i, symbol in enumerate(symbols)};
+    for node in ordered_nodes:
+        key = id(node);
+        if node.type == "symbol":
+            if node.value not in substitutions:
+                raise UserError("No value was given for the symbol '{}'".format(node.value));
+            values[key] = substitutions[node.value];
+            gradients[key] = [1.0 if i == index.get(node.value) else None for i in range(len(symbols))];
+        elif node.type == "number":
+            values[key] = number(node.value);
+            gradients[key] = [None] * len(symbols);
+        else:
+            arguments = [values[id(subtree)] for subtree in node.subtrees];
+            argument_gradients = [gradients[id(subtree)] for subtree in node.subtrees];
+            name = getattr(node, "name", None);
+            if name in OPERATIONS and node.function is OPERATIONS[name]:
+                values[key], gradients[key] = differentiate_operation(name, library, arguments, argument_gradients);
+                continue;
+
+            values[key] = evaluate_function(node)(*arguments);
+            gradient = [None] * len(symbols);
+            if any(g is not None for argument_gradient in argument_gradients for g in argument_gradient):
+                partials = get_function_partials(node.function);
+                if partials is None or len(partials) < len(arguments):
+                    raise UserError("No derivative is known for the function '{}'. Register one with Parser.define_derivatives".format(name));
+                for partial, argument_gradient in zip(partials, argument_gradients):
+                    if all(g is None for g in argument_gradient):
+                        continue;
+                    try:
+                        factor = partial(*arguments);
+                    except ZeroDivisionError: # e.g. sqrt at 0, where the value is defined but the slope is not
+                        factor = math.inf;
+                    gradient = [add(g, scale(h, factor)) for g, h in zip(gradient, argument_gradient)];
+            gradients[key] = gradient;
+    root = id(ordered_nodes[-1]);
+    return values[root], gradients[root];
+
+
+def evaluate_with_gradient(ordered_nodes, substitutions, symbols=None, derivatives=None):
+    """ value and {symbol: partial derivative} at scalar values, in floats. differentiates with respect to symbols (default: every substituted symbol). derivatives holds the registered partials of user defined functions """
+    symbols = tuple(substitutions if symbols is None else symbols);
+    substitutions = {symbol: float(value) for symbol, value in substitutions.items()};
+    try:
+        value, gradient = propagate(ordered_nodes, substitutions, symbols, math, float, lambda node: node.function, lambda function: get_partials(function, math, None, derivatives));
+    except ZeroDivisionError:
+        raise EvaluationError("Division by zero");
+    except ValueError:
+        raise EvaluationError("Function input is out of domain");
+    return value, {symbol: 0.0 if g is None else g for symbol, g in zip(symbols, gradient)};
+
+
+def batch_evaluate_with_gradient(ordered_nodes, substitutions, symbols=None, derivatives=None):
+    """ value and {symbol: partial derivative} over arrays. returns (values, gradient, mask), mask is True where the value or a partial is not finite """
+    import numpy as np;
+    from CAS.Vectorize import get_ufunc, vectorize_function;
+
+    symbols = tuple(substitutions if symbols is None else symbols);
+    arrays = {symbol: np.asarray(value, dtype=float) for symbol, value in substitutions.items()};
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()));
+    with np.errstate(all="ignore"):
+        value, gradient = propagate(ordered_nodes, arrays, symbols, np, np.float64, get_ufunc, lambda function: get_partials(function, np, vectorize_function, derivatives));
+        value = np.array(np.broadcast_to(value, shape), dtype=float);
+        gradient = {symbol: np.zeros(shape) if g is None else np.array(np.broadcast_to(g, shape), dtype=float) for symbol, g in zip(symbols, gradient)};
+    mask = ~np.isfinite(value);
+    for partial in gradient.values():
+        mask |= ~np.isfinite(partial);
+    return value, gradient, mask;
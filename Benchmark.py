@@ -0,0 +1,185 @@
+import sys;
+import json;
+import math;
+import cmath;
+import random;
+import platform;
+import argparse;
+import statistics;
+import tracemalloc;
+from time import perf_counter, strftime;
+from CAS.Tokenizer import Tokenizer;
+from CAS.Parser import Parser;
+from CAS.tests import expressions as HANDWRITTEN;
+
+# Benchmark suite. Every case is a list of expressions; every stage (tokenizing, parsing, evaluating...) is timed over
+# the whole list. Timings are seconds per pass over the list: each run repeats the pass enough times to last at least
+# MINIMUM_RUN_TIME, after warmup runs that are discarded. Results can be saved as JSON and compared with a saved baseline.
+# Run it with: python -m CAS.Benchmark [--output results.json] [--baseline baseline.json]
+
+MINIMUM_RUN_TIME = 0.05;
+FUNCTION_NAMES = ("sin", "cos", "atan", "tanh", "sinh", "exp", "asin", "acos");
+SYMBOL_NAMES = "xyzabcdfghjkmnpqrstuvw";
+
+REAL_FUNCTIONS = {name: getattr(math, name) for name in FUNCTION_NAMES};
+COMPLEX_FUNCTIONS = {name: getattr(cmath, name) for name in FUNCTION_NAMES};
+
+STAGES = ("tokenize", "parse", "parse_equation", "evaluate", "evaluate_exact", "complex_evaluate");
+
+
+def generate_expression(terms=1, depth=1, functions=3, symbols=3, seed=0):
+    """ a random sum of terms, each a coefficient times a symbol times a chain of depth nested calls drawn from the first functions FUNCTION_NAMES, using the first symbols letters """
+    generator = random.Random(seed);
+    names, letters = FUNCTION_NAMES[:functions], SYMBOL_NAMES[:symbols];
+    parts = [];
+    for i in range(terms):
+        inner = generator.choice(letters);
+        for level in range(depth):
+            if names:
+                # sin keeps every argument in [-1/2, 1/2], inside the domains of asin and acos and far from overflow
+                inner = "{}(sin({})/2)".format(generator.choice(names), inner);
+            else:
+                inner = "({}+{})".format(inner, generator.choice(letters));
+        term = "{}{}*{}".format(generator.randint(1, 9), generator.choice(letters), inner);
+        parts.append(term if i == 0 else generator.choice("+-") + term);
+    return "".join(parts);
+
+
+def get_corpus():
+    """ the benchmark cases: {name: (expressions, symbols)} """
+    corpus = {"handwritten": (list(HANDWRITTEN), "xyz")};
+    for terms in (1, 10, 100):
+        corpus["terms={}".format(terms)] = ([generate_expression(terms=terms, seed=seed) for seed in range(5)], SYMBOL_NAMES[:3]);
+    for depth in (1, 10, 50):
+        corpus["depth={}".format(depth)] = ([generate_expression(depth=depth, seed=seed) for seed in range(5)], SYMBOL_NAMES[:3]);
+    for functions in (1, 4, 8):
+        corpus["functions={}".format(functions)] = ([generate_expression(terms=10, depth=2, functions=functions, seed=seed) for seed in range(5)], SYMBOL_NAMES[:3]);
+    for symbols in (1, 5, 20):
+        corpus["symbols={}".format(symbols)] = ([generate_expression(terms=10, symbols=symbols, seed=seed) for seed in range(5)], SYMBOL_NAMES[:symbols]);
+    return corpus;
+
+
+def measure(function, repeat=5, warmup=1):
+    """ time function. returns statistics of the seconds per call over repeat runs """
+    for i in range(warmup):
+        function();
+    number, elapsed = 1, 0;
+    while True: # find a number of calls that takes at least MINIMUM_RUN_TIME
+        start = perf_counter();
+        for i in range(number):
+            function();
+        elapsed = perf_counter() - start;
+        if elapsed >= MINIMUM_RUN_TIME:
+            break;
+        number *= 2 if elapsed == 0 else max(2, min(10, math.ceil(MINIMUM_RUN_TIME / elapsed)));
+    times = [elapsed / number];
+    for i in range(repeat - 1):
+        start = perf_counter();
+        for j in range(number):
+            function();
+        times.append((perf_counter() - start) / number);
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "repeat": repeat,
+        "number": number
+    };
+
+
+def measure_memory(expressions, symbols):
+    """ bytes allocated per tree and per distinct node when parsing expressions with a new parser """
+    parser = Parser(REAL_FUNCTIONS, list(symbols), cache_size=0);
+    tracemalloc.start();
+    before = tracemalloc.get_traced_memory()[0];
+    trees = [parser.parse(expression) for expression in expressions];
+    size = tracemalloc.get_traced_memory()[0] - before;
+    tracemalloc.stop();
+    nodes = len({id(node) for tree in trees for node in tree.get_ordered_nodes()});
+    return {"bytes_per_tree": size / len(trees), "bytes_per_node": size / nodes, "nodes": nodes};
+
+
+def get_stages(expressions, symbols):
+    """ {stage: function running the stage over every expression} """
+    tokenizer = Tokenizer(REAL_FUNCTIONS, list(symbols));
+    # the caches are disabled so parsing is measured, not cache lookups
+    parser = Parser(REAL_FUNCTIONS, list(symbols), cache_size=0);
+    complex_parser = Parser(COMPLEX_FUNCTIONS, list(symbols), cache_size=0);
+    trees = [parser.parse(expression) for expression in expressions];
+    complex_trees = [complex_parser.parse(expression) for expression in expressions];
+    equations = ["{}={}".format(expression, expressions[i - 1]) for i, expression in enumerate(expressions)];
+
+    generator = random.Random(0);
+    values = {symbol: generator.uniform(0.1, 0.9) for symbol in symbols};
+    complex_values = {symbol: complex(value, generator.uniform(-0.5, 0.5)) for symbol, value in values.items()};
+    return {
+        "tokenize": lambda: [tokenizer.tokenize(expression) for expression in expressions],
+        "parse": lambda: [parser.parse(expression) for expression in expressions],
+        "parse_equation": lambda: [parser.parse_equation(equation) for equation in equations],
+        "evaluate": lambda: [tree.evaluate(**values) for tree in trees],
+        "evaluate_exact": lambda: [tree.evaluate_exact(**values) for tree in trees],
+        "complex_evaluate": lambda: [tree.complex_evaluate(**complex_values) for tree in complex_trees]
+    };
+
+
+def run(cases=None, stages=STAGES, repeat=5, warmup=1, log=None):
+    """ run the benchmark cases (default: all of get_corpus) and return the results as a JSON compatible dict """
+    corpus = get_corpus();
+    results = {
+        "metadata": {"python": platform.python_version(), "implementation": platform.python_implementation(), "platform": platform.platform(), "time": strftime("%Y-%m-%dT%H:%M:%S")},
+        "cases": {}
+    };
+    for name in (corpus if cases is None else cases):
+        expressions, symbols = corpus[name];
+        functions = get_stages(expressions, symbols);
+        case = {"expressions": len(expressions), "memory": measure_memory(expressions, symbols), "stages": {}};
+        for stage in stages:
+            case["stages"][stage] = measure(functions[stage], repeat, warmup);
+            if log is not None:
+                log("{:<14} {:<17} {:>12.1f} us".format(name, stage, case["stages"][stage]["median"] * 1e6));
+        results["cases"][name] = case;
+    return results;
+
+
+def compare(results, baseline, tolerance=0.1):
+    """ the (case, measurement, baseline value, current value) of every median time or memory use more than tolerance worse than in baseline """
+    regressions = [];
+    for name, case in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue;
+        old = baseline["cases"][name];
+        pairs = [(stage, old["stages"][stage]["median"], stats["median"]) for stage, stats in case["stages"].items() if stage in old["stages"]];
+        pairs.append(("bytes_per_tree", old["memory"]["bytes_per_tree"], case["memory"]["bytes_per_tree"]));
+        regressions += [(name, measurement, before, after) for measurement, before, after in pairs if after > before * (1 + tolerance)];
+    return regressions;
+
+
+def main(arguments=None):
+    """ command line entry point. the exit status is 1 if there are regressions against the baseline """
+    argument_parser = argparse.ArgumentParser(description="Benchmark tokenizing, parsing and evaluating expressions");
+    argument_parser.add_argument("--output", help="save the results to this JSON file");
+    argument_parser.add_argument("--baseline", help="compare the results with this JSON file");
+    argument_parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression");
+    argument_parser.add_argument("--repeat", type=int, default=5);
+    argument_parser.add_argument("--warmup", type=int, default=1);
+    argument_parser.add_argument("--case", action="append", dest="cases", help="run only this case (can be repeated)");
+    argument_parser.add_argument("--stage", action="append", dest="stages", choices=STAGES, help="run only this stage (can be repeated)");
+    options = argument_parser.parse_args(arguments);
+
+    results = run(options.cases, options.stages or STAGES, options.repeat, options.warmup, log=print);
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2);
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressions = compare(results, json.load(file), options.tolerance);
+        for name, measurement, before, after in regressions:
+            print("REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.0%})".format(name, measurement, before, after, after / before - 1));
+        if regressions:
+            return 1;
+    return 0;
+
+
+if __name__ == "__main__":
+    sys.exit(main());
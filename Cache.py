@@ -0,0 +1,48 @@
+from collections import OrderedDict, namedtuple;
+from CAS.Errors import UserError;
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"]);
+
+
+class LRUCache():
+
+    """ A bounded mapping that discards the least recently used entry when full """
+
+    def __init__(self, maxsize=256):
+        if not isinstance(maxsize, int) or maxsize < 0:
+            raise UserError("Cache size must be a non-negative integer. Actual size: {}".format(maxsize));
+        self.maxsize = maxsize;
+        self._entries = OrderedDict();
+        self.hits = self.misses = 0;
+
+    def __len__(self):
+        return len(self._entries);
+
+    def get(self, key, default=None):
+        """ get the value stored for key and mark it as recently used """
+        try:
+            value = self._entries[key];
+        except KeyError:
+            self.misses += 1;
+            return default;
+        self._entries.move_to_end(key);
+        self.hits += 1;
+        return value;
+
+    def put(self, key, value):
+        """ store a value, evicting the least recently used entry if the cache is full """
+        if self.maxsize == 0:
+            return;
+        self._entries[key] = value;
+        self._entries.move_to_end(key);
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False);
+
+    def clear(self):
+        """ remove all entries. statistics are kept """
+        self._entries.clear();
+
+    def info(self):
+        """ hit/miss statistics, in the same form as functools.lru_cache """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries));
@@ -0,0 +1,122 @@
+from CAS.Errors import UserError, EvaluationError;
+from CAS.data import OPERATIONS;
+
+
+INLINE_OPERATIONS = {
+    "+": "{} + {}",
+    "-": "{} - {}",
+    "*": "{} * {}",
+    "/": "{} / {}",
+    "%": "{} % {}",
+    "^": "{} ** {}",
+    "~": "-{}"
+};
+
+# names the exact engine's operations are bound to in generated code
+EXACT_NAMES = {
+    "+": "_add",
+    "-": "_subtract",
+    "*": "_multiply",
+    "/": "_divide",
+    "%": "_modulo",
+    "^": "_power",
+    "~": "_negate"
+};
+
+MODES = ("float", "exact", "complex");
+
+
+def power(a, b):
+    """ a ** b in floats, raising ValueError instead of returning a complex number """
+    result = a ** b;
+    if type(result) is complex:
+        raise ValueError("a negative number cannot be raised to a fractional power");
+    return result;
+
+
+def get_ordered_nodes(tree):
+    """ return the distinct nodes of a tree in post-order (children before parents). does not recurse so deep trees are fine """
+    ordered, seen, stack = [], set(), [(tree, False)];
+    while stack:
+        node, expanded = stack.pop();
+        if id(node) in seen:
+            continue;
+        if node.type != "tree" or expanded:
+            seen.add(id(node));
+            ordered.append(node);
+        else:
+            stack.append((node, True));
+            stack.extend((subtree, False) for subtree in reversed(node.subtrees));
+    return ordered;
+
+
+def generate_source(tree, symbols, mode="float"):
+    """ generate the source of a Python function evaluating tree. returns the source and the namespace it must be executed in """
+    if mode not in MODES:
+        raise UserError("Compilation mode must be one of {}. Actual mode: {}".format(MODES, mode));
+
+    namespace = {"EvaluationError": EvaluationError, "_real_power": power};
+    expressions, body = {}, [];
+    if mode == "exact":
+        from CAS import Exact; # not imported at the top because Exact is also used by modules that Compiler is imported by
+        namespace.update({"_input": Exact.from_input, "_result": Exact.from_result, "_argument": Exact.to_argument, "_output": Exact.to_output});
+        namespace.update({EXACT_NAMES[name]: operation for name, operation in Exact.EXACT_OPERATIONS.items()});
+
+    for node in get_ordered_nodes(tree):
+        if node.type == "symbol":
+            if node.value not in symbols:
+                raise UserError("Symbol '{}' is not one of the ordered symbols {}".format(node.value, tuple(symbols)));
+            expressions[id(node)] = node.value;
+        elif node.type == "number":
+            if mode == "exact":
+                name = "_c{}".format(len(namespace));
+                namespace[name] = Exact.from_input(node.value);
+                expressions[id(node)] = name;
+            else:
+                literal = repr(float(node.value));
+                expressions[id(node)] = "({})".format(literal) if literal.startswith("-") else literal;
+        else:
+            arguments = [expressions[id(subtree)] for subtree in node.subtrees];
+            name = getattr(node, "name", None);
+            is_operation = name in INLINE_OPERATIONS and node.function is OPERATIONS[name];
+            if is_operation and mode == "exact":
+                expression = "{}({})".format(EXACT_NAMES[name], ", ".join(arguments));
+            elif is_operation and name == "^" and mode == "float":
+                expression = "_real_power({}, {})".format(*arguments);
+            elif is_operation:
+                expression = INLINE_OPERATIONS[name].format(*arguments);
+            else:
+                function_name = "_f{}".format(len(namespace));
+                namespace[function_name] = node.function;
+                if mode == "exact":
+                    expression = "_result({}({}))".format(function_name, ", ".join("_argument({})".format(argument) for argument in arguments));
+                else:
+                    expression = "{}({})".format(function_name, ", ".join(arguments));
+            temporary = "_t{}".format(len(body));
+            body.append("{} = {}".format(temporary, expression));
+            expressions[id(node)] = temporary;
+
+    prologue = ["{0} = _input({0})".format(symbol) for symbol in symbols] if mode == "exact" else [];
+    result = "_output({})".format(expressions[id(tree)]) if mode == "exact" else expressions[id(tree)];
+    lines = ["def compiled({}):".format(", ".join(symbols)), "    try:"];
+    lines += ["        " + line for line in prologue + body];
+    lines += [
+        "        return {}".format(result),
+        "    except ZeroDivisionError:",
+        "        raise EvaluationError(\"Division by zero\") from None",
+        "    except ValueError:",
+        "        raise EvaluationError(\"Function input is out of domain\") from None",
+        "    except OverflowError:",
+        "        raise EvaluationError(\"Result is too large\") from None"
+    ];
+    return "\n".join(lines), namespace;
+
+
+def compile_tree(tree, symbols, mode="float"):
+    """ compile tree into a Python function taking one positional argument per symbol, in order """
+    symbols = tuple(symbols);
+    source, namespace = generate_source(tree, symbols, mode);
+    exec(compile(source, "<ParseTree:{}>".format(mode), "exec"), namespace);
+    function = namespace["compiled"];
+    function.source = source;
+    return function;
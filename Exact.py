@@ -0,0 +1,204 @@
+from fractions import Fraction;
+from math import gcd;
+from CAS.Errors import EvaluationError, InternalError;
+from CAS.data import OPERATIONS;
+
+# Exact values are ints, or (numerator, denominator) pairs with a positive denominator other than 1.
+# Pairs are only reduced once their denominator grows past REDUCTION_BITS, and when the result is returned.
+# Floats are inexact values (e.g. results of irrational functions); once a float is involved, arithmetic continues in floats.
+
+REDUCTION_BITS = 256;
+MAXIMUM_ROOT_DEGREE = 64; # exact roots are only attempted for exponents p/q with q up to this
+
+
+def make_rational(numerator, denominator):
+    """ an exact value from a numerator and a non-zero denominator """
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator;
+    if denominator == 1:
+        return numerator;
+    if denominator.bit_length() > REDUCTION_BITS:
+        divisor = gcd(numerator, denominator);
+        numerator, denominator = numerator // divisor, denominator // divisor;
+        if denominator == 1:
+            return numerator;
+    return (numerator, denominator);
+
+
+def is_exact(value):
+    """ whether value is an exact int or pair """
+    return type(value) is int or type(value) is tuple;
+
+
+def inexact(value):
+    """ a value as a float (ints are left to Python's mixed arithmetic so large ones do not overflow) """
+    return value[0] / value[1] if type(value) is tuple else value;
+
+
+def from_input(value):
+    """ convert a substitution. floats are taken at their exact binary value """
+    if type(value) is int:
+        return value;
+    elif isinstance(value, Fraction):
+        return make_rational(value.numerator, value.denominator);
+    elif isinstance(value, float):
+        return make_rational(*value.as_integer_ratio());
+    elif isinstance(value, int): # bool and other int subclasses
+        return int(value);
+    raise InternalError("An internal error has occurred. Details: the exact engine expected an int, float or Fraction but got {} instead".format(type(value)));
+
+
+def from_result(value):
+    """ convert the result of a function. float results are inexact """
+    if isinstance(value, float):
+        return value;
+    return from_input(value);
+
+
+def to_argument(value):
+    """ convert a value to what functions expect: a Fraction if it is exact """
+    if type(value) is int:
+        return Fraction(value);
+    elif type(value) is tuple:
+        return Fraction(*value);
+    return value;
+
+
+def to_output(value):
+    """ the final result: a reduced Fraction if it is exact, a float otherwise """
+    return to_argument(value);
+
+
+def add(a, b):
+    if type(a) is int and type(b) is int:
+        return a + b;
+    if not (is_exact(a) and is_exact(b)):
+        return inexact(a) + inexact(b);
+    (an, ad), (bn, bd) = (a if type(a) is tuple else (a, 1)), (b if type(b) is tuple else (b, 1));
+    if ad == bd:
+        return make_rational(an + bn, ad);
+    return make_rational(an * bd + bn * ad, ad * bd);
+
+
+def negate(a):
+    return (-a[0], a[1]) if type(a) is tuple else -a;
+
+
+def subtract(a, b):
+    return add(a, negate(b));
+
+
+def multiply(a, b):
+    if type(a) is int and type(b) is int:
+        return a * b;
+    if not (is_exact(a) and is_exact(b)):
+        return inexact(a) * inexact(b);
+    (an, ad), (bn, bd) = (a if type(a) is tuple else (a, 1)), (b if type(b) is tuple else (b, 1));
+    return make_rational(an * bn, ad * bd);
+
+
+def divide(a, b):
+    if not (is_exact(a) and is_exact(b)):
+        return inexact(a) / inexact(b);
+    (an, ad), (bn, bd) = (a if type(a) is tuple else (a, 1)), (b if type(b) is tuple else (b, 1));
+    if bn == 0:
+        raise ZeroDivisionError("division by zero");
+    return make_rational(an * bd, ad * bn);
+
+
+def modulo(a, b):
+    if type(a) is int and type(b) is int:
+        return a % b;
+    if not (is_exact(a) and is_exact(b)):
+        return inexact(a) % inexact(b);
+    (an, ad), (bn, bd) = (a if type(a) is tuple else (a, 1)), (b if type(b) is tuple else (b, 1));
+    return make_rational((an * bd) % (bn * ad), ad * bd);
+
+
+def integer_root(n, degree):
+    """ the integer degree-th root of a non-negative int, or None if it is not a perfect power """
+    if n < 2:
+        return n;
+    x = 1 << -(-n.bit_length() // degree); # an upper bound of the root
+    while True:
+        y = ((degree - 1) * x + n // x ** (degree - 1)) // degree;
+        if y >= x:
+            break;
+        x = y;
+    return x if x ** degree == n else None;
+
+
+def exact_root(a, degree):
+    """ the exact degree-th root of a non-negative exact value, or None if it is irrational """
+    if degree > MAXIMUM_ROOT_DEGREE:
+        return None;
+    numerator, denominator = a if type(a) is tuple else (a, 1);
+    if numerator < 0:
+        return None;
+    # pairs are only reduced lazily, and an unreduced pair such as (2, 8) has a rational root although 2 and 8 have none
+    divisor = gcd(numerator, denominator);
+    numerator, denominator = integer_root(numerator // divisor, degree), integer_root(denominator // divisor, degree);
+    if numerator is None or denominator is None:
+        return None;
+    return make_rational(numerator, denominator);
+
+
+def power(a, b):
+    if type(b) is int and is_exact(a):
+        numerator, denominator = a if type(a) is tuple else (a, 1);
+        if b >= 0:
+            return make_rational(numerator ** b, denominator ** b);
+        if numerator == 0:
+            raise ZeroDivisionError("zero cannot be raised to a negative power");
+        return make_rational(denominator ** -b, numerator ** -b);
+    if type(b) is tuple and is_exact(a):
+        divisor = gcd(*b);
+        root = exact_root(a, b[1] // divisor);
+        if root is not None:
+            return power(root, b[0] // divisor);
+    result = inexact(a) ** inexact(b);
+    if type(result) is complex:
+        raise ValueError("a negative number cannot be raised to a fractional power");
+    return result;
+
+
+EXACT_OPERATIONS = {
+    "+": add,
+    "-": subtract,
+    "*": multiply,
+    "/": divide,
+    "%": modulo,
+    "~": negate,
+    "^": power
+};
+
+
+def get_exact_operation(node):
+    """ the exact engine implementation of a node's operation, or None if it is a function """
+    name = getattr(node, "name", None);
+    if name in EXACT_OPERATIONS and node.function is OPERATIONS[name]:
+        return EXACT_OPERATIONS[name];
+    return None;
+
+
+def exact_evaluate(ordered_nodes, substitutions):
+    """ evaluate the nodes of a tree (children before parents, root last) with exact rational arithmetic. returns a Fraction, or a float if an irrational function made the result inexact """
+    values = {};
+    try:
+        for node in ordered_nodes:
+            if node.type == "tree":
+                arguments = [values[id(subtree)] for subtree in node.subtrees];
+                operation = get_exact_operation(node);
+                if operation is not None:
+                    values[id(node)] = operation(*arguments);
+                else:
+                    values[id(node)] = from_result(node.function(*[to_argument(argument) for argument in arguments]));
+            elif node.type == "symbol":
+                values[id(node)] = from_input(substitutions[node.value]);
+            else:
+                values[id(node)] = from_input(node.value);
+    except ZeroDivisionError:
+        raise EvaluationError("Division by zero");
+    except ValueError:
+        raise EvaluationError("Function input is out of domain");
+    return to_output(values[id(ordered_nodes[-1])]);
@@ -0,0 +1,77 @@
+from CAS.Errors import UserError, EvaluationError;
+from CAS.data import OPERATIONS;
+from CAS.Compiler import power;
+
+# Re-evaluation of a tree when only some symbols change. Every node knows the symbols its subtree depends on
+# (ParseTree.get_dependencies), so a call only recomputes the nodes that depend on a changed symbol and reuses
+# the cached values of the others. The nodes to recompute for a set of changed symbols are worked out once.
+
+
+class IncrementalEvaluator():
+
+    """ Evaluates a tree in floats repeatedly, recomputing only the subtrees that depend on symbols that changed since the last call """
+
+    def __init__(self, tree):
+        self.tree = tree;
+        self.nodes = tree.get_ordered_nodes();
+        self.symbols = tree.get_dependencies();
+        self.root = id(self.nodes[-1]);
+        self.plans = {};
+        self.values = {};
+        self.substitutions = {};
+        self.recomputed = 0; # number of nodes recomputed by the last call
+
+    def plan(self, changed):
+        """ the (key, function, symbol, child keys) steps recomputing the nodes that depend on the symbols in changed, children first. None means every node """
+        if changed not in self.plans:
+            steps = [];
+            for node in self.nodes:
+                if changed is None:
+                    dependent = True;
+                else:
+                    dependent = node.type != "number" and not changed.isdisjoint(node.dependencies);
+                if not dependent:
+                    continue;
+                if node.type == "number":
+                    steps.append((id(node), None, float(node.value), ()));
+                elif node.type == "symbol":
+                    steps.append((id(node), None, node.value, None));
+                else:
+                    function = power if node.name == "^" and node.function is OPERATIONS["^"] else node.function;
+                    steps.append((id(node), function, None, tuple(id(subtree) for subtree in node.subtrees)));
+            self.plans[changed] = steps;
+        return self.plans[changed];
+
+    def evaluate(self, **substitutions):
+        """ evaluate at specific values. symbols that are not given keep their value from the previous call """
+        if self.values:
+            changed = frozenset(symbol for symbol, value in substitutions.items() if symbol in self.symbols and self.substitutions[symbol] != value);
+        else:
+            missing = self.symbols.difference(self.substitutions, substitutions);
+            if missing:
+                raise UserError("No value was given for the symbols {}".format(tuple(sorted(missing))));
+            changed = None;
+        self.substitutions.update(substitutions);
+        if changed is not None and not changed:
+            self.recomputed = 0;
+            return self.values[self.root];
+
+        steps, values = self.plan(changed), self.values;
+        try:
+            for key, function, argument, children in steps:
+                if function is not None:
+                    values[key] = function(*[values[child] for child in children]);
+                elif children is None:
+                    values[key] = float(self.substitutions[argument]);
+                else:
+                    values[key] = argument;
+        except (ZeroDivisionError, ValueError) as error:
+            # the cached values are only partly updated, so the next call starts over
+            self.values = {};
+            raise EvaluationError("Division by zero" if isinstance(error, ZeroDivisionError) else "Function input is out of domain") from None;
+        self.recomputed = len(steps);
+        return values[self.root];
+
+    def reset(self):
+        """ forget the cached values, so the next call evaluates the whole tree """
+        self.values = {};
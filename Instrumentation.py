@@ -0,0 +1,148 @@
+from time import perf_counter;
+from functools import wraps;
+from CAS.Errors import UserError;
+from CAS.data import OPERATIONS;
+from CAS.Tokenizer import Tokenizer;
+from CAS.Parser import Parser, ParseTree;
+
+# Opt-in instrumentation. While a Profile is active, the instrumented methods are replaced on their classes by
+# wrappers that record into it, and the originals are put back when it exits, so nothing is paid when profiling is off.
+#
+#     with Profile() as profile:
+#         tree = parser.parse("sin(x)^2");
+#         tree.evaluate(x=1);
+#     print(profile.report());
+
+# (class or module, attribute, phase name) of the methods timed as phases
+PHASES = (
+    (Tokenizer, "tokenize", "tokenize"),
+    (Parser, "parse", "parse"),
+    (Parser, "parse_equation", "parse_equation"),
+    (Parser, "_Parser__parse_string", "parse (cache miss)"),
+    (ParseTree, "evaluate", "evaluate"),
+    (ParseTree, "quick_unsafe_evaluate", "evaluate"),
+    (ParseTree, "evaluate_with_dict", "evaluate"),
+    (ParseTree, "complex_evaluate", "complex_evaluate"),
+    (ParseTree, "evaluate_exact", "evaluate_exact"),
+    (ParseTree, "quick_unsafe_evaluate_exact", "evaluate_exact"),
+    (ParseTree, "compile", "compile")
+);
+
+# methods applying the function of one node, which are counted and timed per node
+NODE_EVALUATORS = ("_ParseTree__apply",);
+
+active = [];
+
+
+def node_name(tree):
+    """ the operator or function name of a node, for reporting """
+    name = getattr(tree, "name", None);
+    if isinstance(name, str):
+        return name;
+    return getattr(tree.function, "__name__", repr(tree.function));
+
+
+class Profile():
+
+    """ Records phase timings, node evaluations per operator and function, and cache hit rates while active """
+
+    def __init__(self):
+        self.phases = {}; # phase: [calls, seconds]
+        self.nodes = {}; # operator or function name: [evaluations, seconds in the node itself, excluding its subtrees]
+        self.caches = {}; # cache: [hits, misses]
+        self.originals = [];
+
+    def __enter__(self):
+        if active:
+            raise UserError("Only one Profile can be active at a time");
+        active.append(self);
+        for owner, attribute, phase in PHASES:
+            self.patch(owner, attribute, self.time_phase(owner.__dict__[attribute], phase));
+        for attribute in NODE_EVALUATORS:
+            self.patch(ParseTree, attribute, self.time_nodes(ParseTree.__dict__[attribute]));
+        self.patch(Parser, "_Parser__cached", self.count_cache(Parser.__dict__["_Parser__cached"]));
+        self.patch(Parser, "_Parser__load_cache_file", self.count_disk_cache(Parser.__dict__["_Parser__load_cache_file"]));
+        return self;
+
+    def __exit__(self, *exception):
+        for owner, attribute, original in reversed(self.originals):
+            setattr(owner, attribute, original);
+        self.originals = [];
+        active.remove(self);
+        return False;
+
+    def patch(self, owner, attribute, wrapper):
+        self.originals.append((owner, attribute, owner.__dict__[attribute]));
+        setattr(owner, attribute, wrapper);
+
+    def time_phase(self, method, phase):
+        record = self.phases.setdefault(phase, [0, 0.0]);
+        @wraps(method)
+        def timed(*arguments, **keywords):
+            start = perf_counter();
+            try:
+                return method(*arguments, **keywords);
+            finally:
+                record[0] += 1;
+                record[1] += perf_counter() - start;
+        return timed;
+
+    def time_nodes(self, method):
+        nodes = self.nodes;
+        @wraps(method)
+        def timed(evaluator, node, arguments):
+            start = perf_counter();
+            try:
+                return method(evaluator, node, arguments);
+            finally:
+                record = nodes.setdefault(node_name(node), [0, 0.0]);
+                record[0] += 1;
+                record[1] += perf_counter() - start;
+        return timed;
+
+    def count_cache(self, method):
+        # only the parse cache is counted: the other LRUCaches (compiled functions, batches) are not lookups of parse results
+        record = self.caches.setdefault("parse", [0, 0]);
+        @wraps(method)
+        def counted(parser, kind, expression, parse):
+            missed = [];
+            def parse_miss(expression):
+                missed.append(True);
+                return parse(expression);
+            tree = method(parser, kind, expression, parse_miss);
+            record[1 if missed else 0] += 1;
+            return tree;
+        return counted;
+
+    def count_disk_cache(self, method):
+        record = self.caches.setdefault("disk", [0, 0]);
+        @wraps(method)
+        def counted(parser, path):
+            tree = method(parser, path);
+            record[0 if tree is not None else 1] += 1;
+            return tree;
+        return counted;
+
+    def stats(self):
+        """ the recorded numbers as a dict of plain values """
+        return {
+            "phases": {phase: {"calls": calls, "seconds": seconds} for phase, (calls, seconds) in self.phases.items() if calls},
+            "nodes": {name: {"evaluations": count, "seconds": seconds} for name, (count, seconds) in self.nodes.items()},
+            "caches": {cache: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)} for cache, (hits, misses) in self.caches.items() if hits + misses}
+        };
+
+    def slowest_functions(self, count=5):
+        """ the (name, evaluations, seconds) of the user defined functions that took the most time, excluding operators """
+        functions = [(name, evaluations, seconds) for name, (evaluations, seconds) in self.nodes.items() if name not in OPERATIONS];
+        return sorted(functions, key=lambda function: function[2], reverse=True)[:count];
+
+    def report(self):
+        """ the recorded numbers as a readable table """
+        stats, lines = self.stats(), [];
+        lines.append("{:<24} {:>10} {:>12}".format("phase", "calls", "ms"));
+        lines += ["{:<24} {:>10} {:>12.3f}".format(phase, record["calls"], record["seconds"] * 1e3) for phase, record in stats["phases"].items()];
+        lines.append("{:<24} {:>10} {:>12}".format("node", "evaluations", "ms (self)"));
+        nodes = sorted(stats["nodes"].items(), key=lambda item: item[1]["seconds"], reverse=True);
+        lines += ["{:<24} {:>10} {:>12.3f}".format(name, record["evaluations"], record["seconds"] * 1e3) for name, record in nodes];
+        lines += ["{} cache: {} hits, {} misses ({:.0%})".format(cache, record["hits"], record["misses"], record["hit_rate"]) for cache, record in stats["caches"].items()];
+        return "\n".join(lines);
@@ -0,0 +1,279 @@
+import math;
+from math import inf, pi, nextafter;
+from CAS.Errors import UserError;
+from CAS.data import OPERATIONS, KNOWN_FUNCTIONS;
+
+# Interval arithmetic. An interval is a (low, high) pair of floats that encloses every value a subtree can take when its
+# symbols range over a box. Results are rounded outwards by one ulp so the enclosures stay valid despite rounding.
+# None is the empty interval: the subtree is undefined everywhere in the box (e.g. sqrt of a negative interval).
+# Arguments are clipped to the domain of each function, so a result only encloses the values that are defined.
+
+EVERYTHING = (-inf, inf);
+MAXIMUM_EXPONENTS = 64; # integer exponents enclosed one by one for a negative base, above which the result is EVERYTHING
+
+
+def register_interval_rule(rules, function, rule):
+    """ register the interval rule of a function in rules (a Parser's registry, keyed by the function itself): a callable taking one (low, high) pair per argument and returning an enclosing (low, high) pair or None """
+    if not callable(function) or not callable(rule):
+        raise UserError("Interval rules can only be registered as callables for callables. Actual values: {}, {}".format(function, rule));
+    rules[function] = rule;
+
+
+def widen(low, high):
+    """ round an interval outwards. nan bounds (e.g. inf - inf) become infinite """
+    low = -inf if low != low else nextafter(low, -inf);
+    high = inf if high != high else nextafter(high, inf);
+    return (low, high);
+
+
+def call(function, x, overflow=inf):
+    """ function(x), or overflow if the result is too large """
+    try:
+        return function(x);
+    except OverflowError:
+        return overflow;
+
+
+def clip(a, low, high):
+    """ the part of a inside [low, high], or None """
+    if a[1] < low or a[0] > high:
+        return None;
+    return (max(a[0], low), min(a[1], high));
+
+
+def product(x, y):
+    """ x * y where 0 * inf is 0, as the bounds of a product of intervals need """
+    return 0.0 if x == 0 or y == 0 else x * y;
+
+
+def add(a, b):
+    return widen(a[0] + b[0], a[1] + b[1]);
+
+
+def subtract(a, b):
+    return widen(a[0] - b[1], a[1] - b[0]);
+
+
+def negate(a):
+    return (-a[1], -a[0]);
+
+
+def multiply(a, b):
+    corners = [product(x, y) for x in a for y in b];
+    return widen(min(corners), max(corners));
+
+
+def divide(a, b):
+    if b[0] <= 0 <= b[1]:
+        return EVERYTHING;
+    return multiply(a, widen(1 / b[1], 1 / b[0]));
+
+
+def modulo(a, b):
+    if b[0] <= 0 <= b[1]:
+        return EVERYTHING;
+    if b[0] == b[1] and math.isfinite(a[0]) and math.isfinite(a[1]) and math.floor(a[0] / b[0]) == math.floor(a[1] / b[0]):
+        return widen(*sorted((a[0] % b[0], a[1] % b[0])));
+    return (min(0.0, b[0]), max(0.0, b[1])); # the result has the sign of the divisor and is smaller than it
+
+
+def integer_power(a, n):
+    """ a ** n for an integer n """
+    if n < 0:
+        return divide((1.0, 1.0), integer_power(a, -n));
+    # x ** n only overflows to -inf for negative x and odd n
+    low, high = [call(lambda x: x ** n, x, -inf if x < 0 and n % 2 else inf) for x in a];
+    if n % 2 == 1:
+        return widen(low, high);
+    if a[0] <= 0 <= a[1]:
+        return widen(0.0, max(low, high));
+    return widen(min(low, high), max(low, high));
+
+
+def union(a, b):
+    """ the smallest interval enclosing a and b, either of which may be None """
+    if a is None or b is None:
+        return a if b is None else b;
+    return (min(a[0], b[0]), max(a[1], b[1]));
+
+
+def power(a, b):
+    if b[0] == b[1] and math.isfinite(b[0]) and b[0] == int(b[0]):
+        return integer_power(a, int(b[0]));
+    # negative bases are only defined for the integer exponents in b
+    negative = None;
+    if a[0] < 0:
+        if not (math.isfinite(b[0]) and math.isfinite(b[1])) or b[1] - b[0] > MAXIMUM_EXPONENTS:
+            negative = EVERYTHING;
+        else:
+            for n in range(math.ceil(b[0]), math.floor(b[1]) + 1):
+                negative = union(negative, integer_power((a[0], min(a[1], 0.0)), n));
+    return union(negative, real_power(a, b));
+
+
+def real_power(a, b):
+    """ a ** b over the non-negative part of a """
+    # real powers are only defined for non-negative bases, where x ** y is monotone in x and y, so the corners are the extremes
+    a = clip(a, 0.0, inf);
+    if a is None:
+        return None;
+    corners = [];
+    for x in a:
+        for y in b:
+            try:
+                corners.append(x ** y);
+            except (ZeroDivisionError, OverflowError):
+                corners.append(inf);
+    if a[0] == 0 and b[0] < 0 < b[1]:
+        corners.append(0.0); # 0 ** y is 0 for y > 0
+    corners = [corner for corner in corners if corner == corner];
+    return widen(min(corners), max(corners)) if corners else EVERYTHING;
+
+
+def increasing(function, low=-inf, high=inf):
+    """ the interval rule of a function that is increasing on its domain [low, high] """
+    def rule(a):
+        a = clip(a, low, high);
+        return None if a is None else widen(*[call(function, x, -inf if x < 0 else inf) for x in a]);
+    return rule;
+
+
+def decreasing(function, low=-inf, high=inf):
+    """ the interval rule of a function that is decreasing on its domain [low, high] """
+    def rule(a):
+        a = clip(a, low, high);
+        return None if a is None else widen(call(function, a[1]), call(function, a[0]));
+    return rule;
+
+
+def contains_point(a, offset, period):
+    """ whether a contains offset + k * period for some integer k """
+    return math.ceil((a[0] - offset) / period) * period + offset <= a[1];
+
+
+def periodic(function, maximum, minimum):
+    """ the interval rule of sin or cos, which have period 2 pi, a maximum of 1 at maximum and a minimum of -1 at minimum """
+    def rule(a):
+        if not (math.isfinite(a[0]) and math.isfinite(a[1])) or a[1] - a[0] >= 2 * pi:
+            return (-1.0, 1.0);
+        # the end values are computed directly: shifting the argument by an inexact multiple of pi would round it
+        values = [function(a[0]), function(a[1])];
+        high_bound = 1.0 if contains_point(a, maximum, 2 * pi) else max(values);
+        low_bound = -1.0 if contains_point(a, minimum, 2 * pi) else min(values);
+        low_bound, high_bound = widen(low_bound, high_bound);
+        return (max(low_bound, -1.0), min(high_bound, 1.0));
+    return rule;
+
+
+def tangent(a):
+    if not (math.isfinite(a[0]) and math.isfinite(a[1])) or a[1] - a[0] >= pi or contains_point(a, pi / 2, pi):
+        return EVERYTHING;
+    return widen(math.tan(a[0]), math.tan(a[1]));
+
+
+def absolute(a):
+    if a[0] >= 0:
+        return a;
+    if a[1] <= 0:
+        return negate(a);
+    return (0.0, max(-a[0], a[1]));
+
+
+def hyperbolic_cosine(a):
+    low, high = call(math.cosh, a[0]), call(math.cosh, a[1]);
+    if a[0] <= 0 <= a[1]:
+        return widen(1.0, max(low, high));
+    return widen(min(low, high), max(low, high));
+
+
+def logarithm_rule(function):
+    """ the interval rule of a logarithm, which is -inf at 0 """
+    return increasing(lambda x: -inf if x == 0 else function(x), 0.0);
+
+
+def logarithm(a, base=None):
+    value = logarithm_rule(math.log)(a);
+    if base is None or value is None:
+        return value;
+    return divide(value, logarithm_rule(math.log)(base) or EVERYTHING);
+
+
+OPERATION_RULES = {
+    "+": add,
+    "-": subtract,
+    "*": multiply,
+    "/": divide,
+    "%": modulo,
+    "~": negate,
+    "^": power
+};
+
+FUNCTION_RULES = {
+    "sin": periodic(math.sin, pi / 2, -pi / 2),
+    "cos": periodic(math.cos, 0.0, pi),
+    "tan": tangent,
+    "asin": increasing(math.asin, -1.0, 1.0),
+    "acos": decreasing(math.acos, -1.0, 1.0),
+    "atan": increasing(math.atan),
+    "sinh": increasing(math.sinh),
+    "cosh": hyperbolic_cosine,
+    "tanh": increasing(math.tanh),
+    "exp": increasing(math.exp),
+    "log": logarithm,
+    "log10": logarithm_rule(math.log10),
+    "log2": logarithm_rule(math.log2),
+    "sqrt": increasing(math.sqrt, 0.0),
+    "abs": absolute,
+    "floor": increasing(math.floor),
+    "ceil": increasing(math.ceil)
+};
+
+
+def get_rule(node, rules=None):
+    """ the interval rule of a node's operation or function, or None if there is none. rules holds the registered rules of user defined functions """
+    name = getattr(node, "name", None);
+    if name in OPERATION_RULES and node.function is OPERATIONS[name]:
+        return OPERATION_RULES[name];
+    try:
+        if rules and node.function in rules:
+            return rules[node.function];
+        return FUNCTION_RULES.get(KNOWN_FUNCTIONS.get(node.function));
+    except TypeError: # unhashable callable
+        return None;
+
+
+def is_bounded(a):
+    return a is not None and math.isfinite(a[0]) and math.isfinite(a[1]);
+
+
+def interval_evaluate(ordered_nodes, box, poles=None, rules=None):
+    """ an interval enclosing the values of a tree (its nodes, children before parents) over a box of {symbol: (low, high) or value}. None if it is undefined everywhere in the box. poles, if a list, collects the nodes whose rule made bounded arguments unbounded (e.g. a division by an interval containing 0). rules holds the registered rules of user defined functions """
+    values = {};
+    for node in ordered_nodes:
+        if node.type == "symbol":
+            if node.value not in box:
+                raise UserError("No interval was given for the symbol '{}'".format(node.value));
+            bounds = box[node.value];
+            values[id(node)] = (float(bounds[0]), float(bounds[1])) if isinstance(bounds, (tuple, list)) else (float(bounds), float(bounds));
+        elif node.type == "number":
+            values[id(node)] = widen(float(node.value), float(node.value)) if float(node.value) != node.value else (float(node.value), float(node.value));
+        else:
+            arguments = [values[id(subtree)] for subtree in node.subtrees];
+            if None in arguments:
+                values[id(node)] = None;
+                continue;
+            rule = get_rule(node, rules);
+            if rule is not None:
+                values[id(node)] = rule(*arguments);
+                if poles is not None and values[id(node)] is not None and not is_bounded(values[id(node)]) and all(is_bounded(argument) for argument in arguments):
+                    poles.append(node);
+            elif all(low == high for low, high in arguments):
+                # no rule is needed at a single point
+                try:
+                    value = float(node.function(*[low for low, high in arguments]));
+                    values[id(node)] = (value, value);
+                except (ZeroDivisionError, ValueError, OverflowError):
+                    values[id(node)] = None;
+            else:
+                values[id(node)] = EVERYTHING; # nothing is known about functions without a rule
+    return values[id(ordered_nodes[-1])];
@@ -1,6 +1,14 @@
 from CAS.data import OPERATIONS;
+from CAS.Errors import UserError, InternalError;
+from CAS.Tokenizer import perfect_ratio;
+from CAS.Compiler import get_ordered_nodes;
+from CAS.Polynomial import Polynomial;
 from CAS import Parser;
 
+
+ASSOCIATIVE_OPERATIONS = {"+": 0, "*": 1}; # operator name: identity element
+
+
 class Manipulator:
 
     """ Algebraic manipulator """
@@ -8,3 +16,218 @@ class Manipulator:
     @staticmethod
     def move_all_terms_to_left(left, right):
         return Parser.ParseTree(OPERATIONS["-"], [left, right], "-", type_="tree");
+
+    @staticmethod
+    def number(value):
+        """ a number leaf """
+        return Parser.ParseTree(None, None, perfect_ratio(value), "number");
+
+    @staticmethod
+    def operation(name, *subtrees):
+        """ a node applying one of OPERATIONS """
+        return Parser.ParseTree(OPERATIONS[name], subtrees, name);
+
+    @staticmethod
+    def operation_name(tree):
+        """ the name of the operation at the root of tree, or None if it is a leaf or a function """
+        name = getattr(tree, "name", None) if tree.type == "tree" else None;
+        return name if name in OPERATIONS and tree.function is OPERATIONS[name] else None;
+
+    @staticmethod
+    def is_number(tree, value=None):
+        """ whether tree is a number leaf (equal to value, if given) """
+        return tree.type == "number" and (value is None or tree.value == value);
+
+    @staticmethod
+    def fold(function, subtrees):
+        """ evaluate a function of number leaves. None if it cannot be evaluated """
+        try:
+            return Manipulator.number(function(*[subtree.value for subtree in subtrees]));
+        except (ZeroDivisionError, ValueError, OverflowError, TypeError, InternalError):
+            # leave errors (and complex results) to be reported when the expression is evaluated
+            return None;
+
+    @staticmethod
+    def flatten(name, tree):
+        """ the operands of a chain of the associative operation name, e.g. [a, b, c] for (a + b) + c """
+        operands, stack = [], [tree];
+        while stack:
+            node = stack.pop();
+            if Manipulator.operation_name(node) == name:
+                stack.extend(reversed(node.subtrees));
+            else:
+                operands.append(node);
+        return operands;
+
+    @staticmethod
+    def simplify_associative(name, tree):
+        """ flatten a chain of + or *, fold all of its constant operands into one and rebuild it """
+        operands = Manipulator.flatten(name, tree);
+        constants = [operand for operand in operands if Manipulator.is_number(operand)];
+        if len(constants) < 2:
+            return tree;
+
+        others = [operand for operand in operands if not Manipulator.is_number(operand)];
+        constant = Manipulator.number(ASSOCIATIVE_OPERATIONS[name]);
+        for operand in constants:
+            constant = Manipulator.number(OPERATIONS[name](constant.value, operand.value));
+        if name == "*" and constant.value == 0:
+            return constant;
+        if constant.value != ASSOCIATIVE_OPERATIONS[name] or not others:
+            others.append(constant);
+
+        result = others[0];
+        for operand in others[1:]:
+            result = Manipulator.operation(name, result, operand);
+        return result;
+
+    @staticmethod
+    def simplify_node(tree, chain_root=True):
+        """ apply identities to a node whose subtrees are already simplified. chains of + and * are only flattened at their chain_root """
+        name = Manipulator.operation_name(tree);
+        if all(Manipulator.is_number(subtree) for subtree in tree.subtrees):
+            folded = Manipulator.fold(tree.function, tree.subtrees);
+            if folded is not None:
+                return folded;
+        if name is None:
+            return tree;
+
+        if name == "~":
+            argument = tree.subtrees[0];
+            if Manipulator.operation_name(argument) == "~":
+                return argument.subtrees[0];
+            return tree;
+
+        left, right = tree.subtrees;
+        if name == "+":
+            if Manipulator.is_number(left, 0): return right;
+            if Manipulator.is_number(right, 0): return left;
+            if Manipulator.operation_name(right) == "~": return Manipulator.operation("-", left, right.subtrees[0]);
+            return Manipulator.simplify_associative(name, tree) if chain_root else tree;
+        elif name == "-":
+            if Manipulator.is_number(right, 0): return left;
+            if Manipulator.is_number(left, 0): return Manipulator.operation("~", right);
+            if Manipulator.operation_name(right) == "~": return Manipulator.operation("+", left, right.subtrees[0]);
+        elif name == "*":
+            if Manipulator.is_number(left, 0) or Manipulator.is_number(right, 0): return Manipulator.number(0);
+            if Manipulator.is_number(left, 1): return right;
+            if Manipulator.is_number(right, 1): return left;
+            return Manipulator.simplify_associative(name, tree) if chain_root else tree;
+        elif name == "/":
+            if Manipulator.is_number(right, 1): return left;
+        elif name == "^":
+            if Manipulator.is_number(right, 1): return left;
+            if Manipulator.is_number(right, 0) or Manipulator.is_number(left, 1): return Manipulator.number(1);
+        return tree;
+
+    @staticmethod
+    def simplify(tree):
+        """ fold constant subtrees into numbers and apply simple identities (x*1, x+0, x^1, x*0, --x, ...). functions are assumed to be pure """
+        nodes, simplified = get_ordered_nodes(tree), {};
+        # a chain of + or * is flattened once, at its root, so long chains take linear time. a node is the root of its chain
+        # unless it is only ever an operand of the same operation
+        chain_roots = {id(tree)};
+        for node in nodes:
+            if node.type == "tree":
+                name = Manipulator.operation_name(node);
+                chain_roots.update(id(subtree) for subtree in node.subtrees if Manipulator.operation_name(subtree) != name);
+        for node in nodes:
+            if node.type != "tree":
+                simplified[id(node)] = node;
+                continue;
+            subtrees = [simplified[id(subtree)] for subtree in node.subtrees];
+            current = node;
+            if any(new is not old for new, old in zip(subtrees, node.subtrees)):
+                current = Parser.ParseTree(node.function, subtrees, node.name);
+            # simplifying can expose another simplification at the new root, e.g. 0 - 2 -> ~2 -> -2
+            while current.type == "tree":
+                new = Manipulator.simplify_node(current, id(node) in chain_roots);
+                if new is current:
+                    break;
+                current = new;
+            simplified[id(node)] = current;
+        return simplified[id(tree)];
+
+    @staticmethod
+    def solve(tree, for_symbol, bracket=None, initial=None, method=None, tolerance=1e-12, max_iterations=100, **parameters):
+        """ solve tree = 0 for for_symbol, vectorized over arrays of parameters (requires numpy). method is 'brent' (default with a bracket), 'bisect' or 'newton' (default with initial guesses). returns a SolveResult of roots, convergence masks and iteration counts """
+        from CAS.Solver import solve;
+        return solve(tree, for_symbol, bracket, initial, method, tolerance, max_iterations, **parameters);
+
+    @staticmethod
+    def polynomials(tree):
+        """ the Polynomial of every node of tree that is a polynomial, keyed by node id. to keep long sums linear, the polynomial of an operand that is only used by one sum is added into that sum in place, and the operand maps to None """
+        nodes, polynomials, uses = get_ordered_nodes(tree), {}, {};
+        for node in nodes:
+            if node.type == "tree":
+                for subtree in node.subtrees:
+                    uses[id(subtree)] = uses.get(id(subtree), 0) + 1;
+        def owned(subtree):
+            """ whether the polynomial of a subtree can be changed in place """
+            return uses[id(subtree)] == 1 and subtree.type == "tree";
+
+        for node in nodes:
+            if node.type == "number":
+                polynomials[id(node)] = Polynomial.constant(node.value);
+                continue;
+            elif node.type == "symbol":
+                polynomials[id(node)] = Polynomial.symbol(node.value);
+                continue;
+            name = Manipulator.operation_name(node);
+            subtrees = [polynomials.get(id(subtree), False) for subtree in node.subtrees];
+            if name is None or False in subtrees:
+                continue;
+            try:
+                if name == "~":
+                    if owned(node.subtrees[0]):
+                        polynomials[id(node)], polynomials[id(node.subtrees[0])] = subtrees[0].negate_in_place(), None;
+                    else:
+                        polynomials[id(node)] = -subtrees[0];
+                elif name in "+-":
+                    sign = 1 if name == "+" else -1;
+                    left, right = node.subtrees;
+                    if owned(left) and (len(subtrees[0].terms) >= len(subtrees[1].terms) or not owned(right)):
+                        polynomials[id(node)] = subtrees[0].add_in_place(subtrees[1], sign);
+                        polynomials[id(left)] = None;
+                    elif owned(right):
+                        polynomials[id(node)] = (subtrees[1] if sign == 1 else subtrees[1].negate_in_place()).add_in_place(subtrees[0]);
+                        polynomials[id(right)] = None;
+                    else:
+                        polynomials[id(node)] = subtrees[0] + subtrees[1] if sign == 1 else subtrees[0] - subtrees[1];
+                elif name == "*":
+                    polynomials[id(node)] = subtrees[0] * subtrees[1];
+                elif name == "/" and subtrees[1].is_constant() and subtrees[1].constant_value() != 0:
+                    polynomials[id(node)] = subtrees[0] * Polynomial.constant(1 / subtrees[1].constant_value());
+                elif name == "^" and subtrees[1].is_constant():
+                    exponent = subtrees[1].constant_value();
+                    if exponent.denominator == 1 and exponent >= 0:
+                        polynomials[id(node)] = subtrees[0] ** int(exponent);
+            except UserError: # too large to expand
+                pass;
+        return polynomials;
+
+    @staticmethod
+    def to_polynomial(tree):
+        """ the Polynomial (sparse, with exact coefficients) that tree is equal to, or None if tree is not a polynomial in its symbols """
+        return Manipulator.polynomials(tree).get(id(tree));
+
+    @staticmethod
+    def to_horner(tree):
+        """ replace every largest polynomial subtree that contains a symbol by its expanded, collected Horner form """
+        nodes, polynomials, rewritten = get_ordered_nodes(tree), Manipulator.polynomials(tree), {};
+        # the largest polynomial subtrees are the root and the operands of nodes that are not polynomials
+        largest = {id(tree)};
+        for node in nodes:
+            if node.type == "tree" and id(node) not in polynomials:
+                largest.update(id(subtree) for subtree in node.subtrees);
+        for node in nodes:
+            if node.type != "tree":
+                rewritten[id(node)] = node;
+            elif id(node) in polynomials:
+                polynomial = polynomials[id(node)];
+                rewritten[id(node)] = polynomial.to_tree() if id(node) in largest and polynomial.get_symbols() else node;
+            else:
+                subtrees = [rewritten[id(subtree)] for subtree in node.subtrees];
+                changed = any(new is not old for new, old in zip(subtrees, node.subtrees));
+                rewritten[id(node)] = Parser.ParseTree(node.function, subtrees, node.name) if changed else node;
+        return rewritten[id(tree)];
@@ -0,0 +1,133 @@
+import os;
+import pickle;
+from itertools import islice;
+from concurrent.futures import ProcessPoolExecutor;
+from CAS.Errors import UserError, EvaluationError;
+from CAS.Parser import Parser;
+
+# Evaluation of one tree at many rows of values, and parsing of many expressions, on a process pool. The tree or the
+# parser configuration is pickled once per worker (functions by reference, see ParseTree.__reduce__); only rows,
+# expressions, results and serialized trees cross process boundaries afterwards.
+
+CHUNKS_PER_WORKER = 4; # default number of chunks per worker, so slow chunks can be balanced between workers
+
+# state of a worker process, set by initialize_worker
+worker = {};
+
+
+def initialize_worker(data):
+    """ load and compile the tree in a worker process """
+    tree = pickle.loads(data);
+    worker["function"] = tree.compile_float();
+    worker["symbols"] = tree.get_ordered_symbols();
+
+
+def evaluate_chunk(chunk):
+    """ evaluate a (start index, rows) chunk. rows are dicts, or tuples in get_ordered_symbols order. returns the results and a list of (index, error message) """
+    start, rows = chunk;
+    function, symbols = worker["function"], worker["symbols"];
+    results, errors = [], [];
+    for index, row in enumerate(rows, start):
+        try:
+            if isinstance(row, dict):
+                row = [row[symbol] for symbol in symbols];
+            results.append(function(*row));
+        except EvaluationError as error:
+            results.append(None);
+            errors.append((index, str(error)));
+        except KeyError as error:
+            raise UserError("Row {} has no value for the symbol {}".format(index, error)) from None;
+    return results, errors;
+
+
+def chunks(rows, chunksize):
+    """ split an iterable into (start index, list of rows) pairs """
+    iterator, start = iter(rows), 0;
+    while True:
+        chunk = list(islice(iterator, chunksize));
+        if not chunk:
+            return;
+        yield start, chunk;
+        start += len(chunk);
+
+
+def check_options(items, workers, chunksize):
+    """ validate the number of workers and the chunk size, choosing defaults. returns (items, workers, chunksize) """
+    workers = (os.cpu_count() or 1) if workers is None else workers;
+    if not isinstance(workers, int) or workers < 1:
+        raise UserError("The number of workers must be a positive integer. Actual value: {}".format(workers));
+    if chunksize is None:
+        if not hasattr(items, "__len__"):
+            items = list(items);
+        chunksize = max(1, -(-len(items) // (workers * CHUNKS_PER_WORKER)));
+    elif not isinstance(chunksize, int) or chunksize < 1:
+        raise UserError("The chunk size must be a positive integer. Actual value: {}".format(chunksize));
+    return items, workers, chunksize;
+
+
+def evaluate_parallel(tree, rows, workers=None, chunksize=None):
+    """ evaluate tree at every row on a process pool. returns (results, errors): the results in input order, None where evaluation failed, and a dict of row index: EvaluationError """
+    rows, workers, chunksize = check_options(rows, workers, chunksize);
+
+    try:
+        data = pickle.dumps(tree);
+    except (pickle.PicklingError, AttributeError, TypeError):
+        raise UserError("Only trees whose functions are defined at module level can be evaluated in parallel") from None;
+
+    results, errors = [], {};
+    def collect(chunk_results):
+        chunk_results, chunk_errors = chunk_results;
+        results.extend(chunk_results);
+        errors.update((index, EvaluationError(message)) for index, message in chunk_errors);
+
+    if workers == 1:
+        initialize_worker(data);
+        for chunk in chunks(rows, chunksize):
+            collect(evaluate_chunk(chunk));
+        return results, errors;
+
+    with ProcessPoolExecutor(workers, initializer=initialize_worker, initargs=(data,)) as executor:
+        for chunk_results in executor.map(evaluate_chunk, chunks(rows, chunksize)):
+            collect(chunk_results);
+    return results, errors;
+
+
+def initialize_parser(data):
+    """ create the parser of a worker process from its pickled (functions, symbols, cache directory, simplify) """
+    functions, symbols, cache_directory, simplify = pickle.loads(data);
+    worker["parser"] = Parser(functions, symbols, cache_directory=cache_directory);
+    worker["simplify"] = simplify;
+
+
+def parse_chunk(chunk):
+    """ parse a (start index, expressions) chunk. returns a list of (serialized tree, None) or (None, error message) """
+    start, expressions = chunk;
+    parser, simplify, results = worker["parser"], worker["simplify"], [];
+    for expression in expressions:
+        try:
+            results.append((parser.parse(expression, simplify).serialize(), None));
+        except UserError as error:
+            results.append((None, str(error)));
+    return results;
+
+
+def parse_parallel(parser, expressions, workers=None, chunksize=None, simplify=False):
+    """ parse expressions with copies of parser on a process pool. returns (trees, errors): the trees in input order, None where parsing failed, and a dict of index: UserError """
+    expressions, workers, chunksize = check_options(expressions, workers, chunksize);
+    tokenizer = parser._tokenizer;
+    try:
+        data = pickle.dumps((tokenizer.functions, list(tokenizer.symbols), parser.cache_directory, simplify));
+    except (pickle.PicklingError, AttributeError, TypeError):
+        raise UserError("Only parsers whose functions are defined at module level can parse in parallel") from None;
+
+    trees, errors = [], {};
+    with ProcessPoolExecutor(workers, initializer=initialize_parser, initargs=(data,)) as executor:
+        for results in executor.map(parse_chunk, chunks(expressions, chunksize)):
+            for tree, message in results:
+                if message is not None:
+                    errors[len(trees)] = UserError(message);
+                    trees.append(None);
+                else:
+                    # the trees are rebuilt from the parent's nodes, so they share subtrees with its other trees
+                    trees.append(parser.deserialize(tree));
+    return trees, errors;
@@ -1,54 +1,96 @@
 from CAS.Tokenizer import *;
 from CAS.Errors import UserError, EvaluationError;
-from CAS.data import PRECEDENCES;
+from CAS.data import ARGUMENT_SEPARATOR;
 from CAS.Manipulator import Manipulator;
+from CAS.Compiler import compile_tree, get_ordered_nodes;
+from CAS.Cache import LRUCache;
+from CAS.Exact import exact_evaluate;
+from CAS.AutoDiff import evaluate_with_gradient, register_derivative;
+from CAS.Interval import interval_evaluate, register_interval_rule;
+from CAS.Precision import adaptive_evaluate, DEFAULT_TOLERANCE;
+from CAS.Serializer import serialize_tree, deserialize_tree, configuration_hash, expression_hash;
+from copy import copy;
+from weakref import WeakValueDictionary;
+import tempfile;
 import math;
+import os;
 
 
-PARENTHESIS_WEIGHT = max(PRECEDENCES.values()) + 1;
+def restore_tree(data, functions, valid_symbols=None):
+    """ unpickle a ParseTree """
+    tree = copy(deserialize_tree(data, functions, make_node));
+    if valid_symbols is not None:
+        tree.set_ordered_subs(valid_symbols);
+    return tree;
+
+
+def make_node(function, subtrees, value, type_="tree"):
+    """ a node in the compact layout used below roots, which holds no per-tree state """
+    if type_ == "tree":
+        return Operation(function, subtrees, value);
+    return Leaf(function, subtrees, value, type_);
 
 
 class ParseTree():
 
     """ A parse tree of a mathematical expression """
 
-    def __init__(self, function, subtrees, value, type_="tree"):
-        self.type = type_;
+    # ParseTree(...) creates a root, which holds the state of one tree (set_ordered_subs, the node order). the nodes below
+    # the roots that Parser hands out are in the compact Operation and Leaf layouts (see make_node): there can be hundreds
+    # of thousands of them, and they are shared between trees (see Parser.intern), so they never hold per-tree state.
+    # dependencies is set on every node by get_dependencies
+    __slots__ = ("dependencies", "__weakref__");
+
+    def __new__(cls, function=None, subtrees=None, value=None, type_="tree"):
+        if cls is ParseTree:
+            cls = OperationRoot if type_ == "tree" else LeafRoot;
+        return object.__new__(cls);
+
+    def __copy__(self):
+        """ a new root with the same structure. defined because copy would otherwise go through __reduce__ """
+        # state that belongs to one root (set_ordered_subs, the node order) is not copied: the copied node may be shared
+        # between trees (see Parser.intern), and state set on it through one tree must not leak into another
         if self.type == "tree":
-            self.function = function;
-            self.subtrees = subtrees;
+            tree = ParseTree(self.function, self.subtrees, self.name);
         else:
-            self.value = value;
-
-    def __evaluate(self, tree, **substitutions):
-        """ evaluate a ParseTree at specific values """
-        try:
-            if tree.type == "tree":
-                for arg in tree.subtrees:
-                    pass;
-                return perfect_ratio(tree.function(*[self.__evaluate(arg, **substitutions) for arg in tree.subtrees]));
-            elif tree.type == "symbol":
-                return perfect_ratio(substitutions[tree.value]);
-            else:
-                return tree.value;
-        except ZeroDivisionError:
-            raise EvaluationError("Division by zero");
-        except ValueError:
-            raise EvaluationError("Function input is out of domain");
-
-    def __complex_evaluate(self, tree, **substitutions):
-        """ evaluate a ParseTree at specific complex values """
+            tree = ParseTree(None, None, self.value, self.type);
+        if hasattr(self, "dependencies"):
+            tree.dependencies = self.dependencies;
+        # the registries belong to the parser, not to the root, so copies keep them
+        if hasattr(self, "derivatives"):
+            tree.derivatives, tree.interval_rules = self.derivatives, self.interval_rules;
+        return tree;
+
+    def __reduce__(self):
+        """ pickle the serialized form. functions are pickled separately, so module level functions are pickled by reference """
+        functions = {node.name: node.function for node in self.get_ordered_nodes() if node.type == "tree" and not (node.name in OPERATIONS and node.function is OPERATIONS[node.name])};
+        return (restore_tree, (self.serialize(), functions, getattr(self, "valid_symbols", None)));
+
+    def serialize(self):
+        """ a compact bytes representation that refers to operators and functions by name. load it with Parser.deserialize """
+        return serialize_tree(self);
+
+    def __apply(self, node, arguments):
+        """ apply the function of a node to the values of its subtrees """
+        return node.function(*arguments);
+
+    def __evaluate(self, substitutions, complex_=False):
+        """ evaluate a ParseTree at specific values, over get_ordered_nodes so deep trees do not recurse and shared subtrees are computed once. complex_ leaves values as they are instead of converting them to ratios """
+        values, apply = {}, self.__apply;
         try:
-            if tree.type == "tree":
-                return tree.function(*[self.__complex_evaluate(arg, **substitutions) for arg in tree.subtrees]);
-            elif tree.type == "symbol":
-                return substitutions[tree.value];
-            else:
-                return tree.value;
+            for node in self.get_ordered_nodes():
+                if node.type == "tree":
+                    value = apply(node, [values[id(subtree)] for subtree in node.subtrees]);
+                    values[id(node)] = value if complex_ else perfect_ratio(value);
+                elif node.type == "symbol":
+                    values[id(node)] = substitutions[node.value] if complex_ else perfect_ratio(substitutions[node.value]);
+                else:
+                    values[id(node)] = node.value;
         except ZeroDivisionError:
             raise EvaluationError("Division by zero");
         except ValueError:
             raise EvaluationError("Function input is out of domain");
+        return values[id(node)];
 
     def evaluate(self, **substitutions):
         """ evaluate at specific values """
@@ -56,35 +98,41 @@ class ParseTree():
         for value in substitutions.values():
             if not isinstance(value, (int, float, Fraction)):
                 raise UserError("expressions can only be evaluated at float values, not {}".format(type(value)));
-        return float(self.__evaluate(self, **substitutions));
+        return float(self.__evaluate(substitutions));
 
     def complex_evaluate(self, **substitutions):
         """ evaluate at specific complex values """
-        return self.__complex_evaluate(self, **substitutions);
+        return self.__evaluate(substitutions, complex_=True);
 
     def quick_unsafe_evaluate(self, **substitutions):
         """ use this only if you are certain that the substitutions are of the correct type """
-        return float(self.__evaluate(self, **substitutions));
+        return float(self.__evaluate(substitutions));
 
     def evaluate_exact(self, **substitutions):
-        """ does not convert to float """
+        """ does not convert to float. returns a Fraction, or a float if an irrational function made the result inexact """
         for value in substitutions.values():
             if not isinstance(value, (int, float, Fraction)):
                 raise UserError("expressions can only be evaluated at float values");
-        return self.__evaluate(self, **substitutions);
+        return exact_evaluate(self.get_ordered_nodes(), substitutions);
 
     def quick_unsafe_evaluate_exact(self, **substitutions):
         """ use this only if you are certain that the substitutions are of the correct type """
-        return self.__evaluate(self, **substitutions);
+        return exact_evaluate(self.get_ordered_nodes(), substitutions);
+
+    def evaluate_adaptive(self, tolerance=DEFAULT_TOLERANCE, **substitutions):
+        """ evaluate in floats with a running error bound, re-evaluating with evaluate_exact when the bound relative to the result is above tolerance """
+        for value in substitutions.values():
+            if not isinstance(value, (int, float, Fraction)):
+                raise UserError("expressions can only be evaluated at float values, not {}".format(type(value)));
+        return adaptive_evaluate(self, substitutions, tolerance);
 
     def evaluate_with_dict(self, substitutions):
         """ evaluate with dict data, not keyword arguments """
-        return float(self.__evaluate(self, **substitutions));
+        return float(self.__evaluate(substitutions));
 
     def set_ordered_subs(self, valid_symbols):
         """ Set a tuple of valid symbols so evaluation doesn't require passing a dict with the correct variable names """
-        self.valid_symbols = valid_symbols;
-        self.valid_symbols_length = len(valid_symbols);
+        raise UserError("set_ordered_subs can only be called on a root, not on a subtree shared between trees. Use copy(subtree)");
 
     def evaluate_with_values_only(self, values: tuple):
         """ evaluate given a tuple of values only. set_ordered_subs must have been called """
@@ -92,115 +140,419 @@ class ParseTree():
         subs = dict(zip(self.valid_symbols, values));
         return self.evaluate_with_dict(subs);
 
+    def evaluate_batch(self, tile_size=None, **substitutions):
+        """ evaluate over arrays (or scalars) of values at once. requires numpy. returns (values, mask), mask is True where evaluation failed. tile_size bounds the size of intermediate arrays """
+        from CAS.Vectorize import batch_evaluate;
+        return batch_evaluate(self, substitutions, float, tile_size);
+
+    def complex_evaluate_batch(self, tile_size=None, **substitutions):
+        """ evaluate_batch over complex arrays, like complex_evaluate. mask is True at poles and other elements that failed to evaluate """
+        from CAS.Vectorize import batch_evaluate;
+        return batch_evaluate(self, substitutions, complex, tile_size);
+
+    def evaluate_parallel(self, substitution_rows, workers=None, chunksize=None):
+        """ evaluate in floats (like compile_float) at each row of substitution_rows on a process pool. rows are dicts, or tuples in get_ordered_symbols order. returns (results, errors): the results in input order, None where evaluation failed, and a dict of row index: EvaluationError """
+        from CAS.Parallel import evaluate_parallel;
+        return evaluate_parallel(self, substitution_rows, workers, chunksize);
+
+    def evaluate_stream(self, rows, chunk_size=1024, errors="raise"):
+        """ lazily evaluate in floats at each of rows (dicts, or tuples in get_ordered_symbols order), chunk_size rows at a time. errors='ignore' yields None for failed rows. see CAS.Stream for file readers and several trees at once """
+        from CAS.Stream import evaluate_stream;
+        return (values[0] for values in evaluate_stream((self,), rows, chunk_size, self.get_ordered_symbols(), errors));
+
+    def evaluate_with_gradient(self, **substitutions):
+        """ evaluate in floats, returning the value and a dict of the partial derivatives with respect to every substituted symbol """
+        return evaluate_with_gradient(self.get_ordered_nodes(), substitutions, None, getattr(self, "derivatives", None));
+
+    def evaluate_batch_with_gradient(self, **substitutions):
+        """ evaluate_with_gradient over arrays. requires numpy. returns (values, gradient, mask), mask is True where the value or a partial is not finite """
+        from CAS.AutoDiff import batch_evaluate_with_gradient;
+        return batch_evaluate_with_gradient(self.get_ordered_nodes(), substitutions, None, getattr(self, "derivatives", None));
+
+    def evaluate_interval(self, **box):
+        """ bounds (low, high) on the value over a box of symbol values, each a (low, high) pair or a number. None if the expression is undefined everywhere in the box """
+        return interval_evaluate(self.get_ordered_nodes(), box, None, getattr(self, "interval_rules", None));
+
+    def sample_curve(self, symbol, low, high, tolerance, max_depth=12, min_depth=2, **fixed):
+        """ adaptively sample for plotting against symbol on [low, high], with the other symbols fixed. returns (x, y) points, y is None where the curve breaks """
+        from CAS.Sampler import sample_curve;
+        return sample_curve(self, symbol, low, high, tolerance, max_depth, min_depth, **fixed);
+
+    def sample_implicit(self, x_symbol, y_symbol, x_range, y_range, resolution, max_depth=10, min_depth=2, **fixed):
+        """ the cells (x_low, x_high, y_low, y_high) that may contain the curve where the expression is 0, for implicit plots of parse_equation results """
+        from CAS.Sampler import sample_implicit;
+        return sample_implicit(self, x_symbol, y_symbol, x_range, y_range, resolution, max_depth, min_depth, **fixed);
+
+    def get_ordered_nodes(self):
+        """ the distinct nodes of the tree, children before parents. computed once per root """
+        return get_ordered_nodes(self);
+
+    def get_dependencies(self):
+        """ the set of symbols the tree depends on. also sets the dependencies attribute of every node to the frozenset of symbols its subtree depends on """
+        for node in self.get_ordered_nodes():
+            if hasattr(node, "dependencies"):
+                continue;
+            if node.type == "symbol":
+                node.dependencies = frozenset((node.value,));
+            elif node.type == "number":
+                node.dependencies = frozenset();
+            else:
+                dependencies = node.subtrees[0].dependencies;
+                for subtree in node.subtrees[1:]:
+                    if not subtree.dependencies <= dependencies: # reuse the sets of subtrees where possible
+                        dependencies = dependencies | subtree.dependencies;
+                node.dependencies = dependencies;
+        return self.dependencies;
+
+    def incremental(self):
+        """ an IncrementalEvaluator, which evaluates in floats and only recomputes the subtrees depending on symbols that changed since its last call """
+        from CAS.Incremental import IncrementalEvaluator;
+        return IncrementalEvaluator(self);
+
+    def get_structure(self):
+        """ a hashable key that is equal for trees of the same shared nodes, e.g. the copies Parser returns for one expression. it references the subtrees, so they stay alive while the key is used """
+        if self.type == "tree":
+            return (self.type, id(self.function), self.name, self.subtrees);
+        return (self.type, self.value);
+
+    def get_symbols(self):
+        """ get the set of symbols that appear in the tree """
+        return {node.value for node in self.get_ordered_nodes() if node.type == "symbol"};
+
+    def get_ordered_symbols(self):
+        """ the symbols in set_ordered_subs order, or sorted if set_ordered_subs has not been called """
+        if hasattr(self, "valid_symbols"):
+            return tuple(self.valid_symbols);
+        return tuple(sorted(self.get_symbols()));
+
+    def compile(self, mode="float"):
+        """ compile into a Python function taking positional arguments in get_ordered_symbols order. mode is 'float', 'exact' or 'complex' """
+        return compile_tree(self, self.get_ordered_symbols(), mode);
+
+    def compile_float(self):
+        """ compile into a function that evaluates in plain floats, like a hand written lambda """
+        return self.compile("float");
+
+    def compile_exact(self):
+        """ compile into a function with the same semantics as evaluate_exact """
+        return self.compile("exact");
+
+    def compile_complex(self):
+        """ compile into a function with the same semantics as complex_evaluate """
+        return self.compile("complex");
+
+class Operation(ParseTree):
+
+    """ A node applying an operator or function to its subtrees """
+
+    __slots__ = ("function", "subtrees", "name");
+    type = "tree";
+
+    def __init__(self, function, subtrees, value, type_="tree"):
+        self.function = function;
+        self.subtrees = tuple(subtrees);
+        self.name = value;
+
+
+class Leaf(ParseTree):
+
+    """ A number or symbol node """
+
+    __slots__ = ("type", "value");
+
+    def __init__(self, function, subtrees, value, type_):
+        self.type = type_;
+        self.value = value;
+
+
+class Root():
+
+    """ The state of one tree, kept on its root. derivatives and interval_rules are the registries of the parser that made the tree (see Parser.define_derivatives) """
+
+    __slots__ = ();
+
+    def set_ordered_subs(self, valid_symbols):
+        """ Set a tuple of valid symbols so evaluation doesn't require passing a dict with the correct variable names """
+        self.valid_symbols = valid_symbols;
+        self.valid_symbols_length = len(valid_symbols);
+
+    def get_ordered_nodes(self):
+        """ the distinct nodes of the tree, children before parents. computed once per root """
+        if not hasattr(self, "ordered_nodes"):
+            self.ordered_nodes = get_ordered_nodes(self);
+        return self.ordered_nodes;
+
+
+class OperationRoot(Root, Operation):
+
+    """ The root of a tree whose top node is an Operation """
+
+    __slots__ = ("valid_symbols", "valid_symbols_length", "ordered_nodes", "derivatives", "interval_rules");
+
+
+class LeafRoot(Root, Leaf):
+
+    """ The root of a tree that is a single number or symbol """
+
+    __slots__ = ("valid_symbols", "valid_symbols_length", "ordered_nodes", "derivatives", "interval_rules");
+
+
 class Parser():
 
     """ object to parse a string into a ParseTree """
 
-    def __init__(self, defined_functions={}, defined_symbols=[]):
+    def __init__(self, defined_functions={}, defined_symbols=[], cache_size=256, cache_directory=None):
         self._tokenizer = Tokenizer(defined_functions, defined_symbols);
+        self._cache = LRUCache(cache_size);
+        self._nodes = WeakValueDictionary();
+        # derivatives and interval rules of defined functions, keyed by the function. they are bound to the trees this parser hands out
+        self._derivatives, self._interval_rules = {}, {};
+        self.cache_directory = cache_directory;
+        self._configuration_directory = (None, None); # (tokenizer configuration, its directory in the cache directory)
 
     def define_functions(self, **functions):
         """ define additional functions """
         temp = self._tokenizer.functions;
         temp.update(functions);
         self._tokenizer.functions = temp;
+        self.__forget_rules();
+        self.clear_cache();
 
     def redefine_functions(self, **functions):
         """ redefine the allowed functions """
         self._tokenizer.functions = functions;
+        self.__forget_rules();
+        self.clear_cache();
 
     def define_symbols(self, *symbols):
         """ define additional symbols """
         self._tokenizer.symbols += symbols;
+        self.clear_cache();
 
     def redefine_symbols(self, *symbols):
         """ redefine the allowed symbols """
         self._tokenizer.symbols = symbols;
+        self.clear_cache();
 
-    def get_arguments(self, tokens):
-        """ split a list of tokens at the argument separator (comma) """
-        result, sub_list, p_count = [], [], 0;
-        for token in tokens:
-            if isinstance(token, OtherToken):
-                if token.value == ",":
-                    if p_count == 1:
-                        result.append(sub_list)
-                        sub_list = [];
-                    else:
-                        sub_list.append(token);
-                elif token.value == "(":
-                    p_count += 1;
-                    sub_list.append(token);
-                elif token.value == ")":
-                    p_count -= 1;
-                    sub_list.append(token);
+    def __node(self, function, subtrees, value, type_="tree"):
+        """ get the shared node for a structure, creating it if no structurally identical node exists """
+        if type_ == "tree":
+            key = (type_, id(function), value, tuple(id(subtree) for subtree in subtrees));
+        else:
+            key = (type_, value);
+        node = self._nodes.get(key);
+        if node is None:
+            node = make_node(function, subtrees, value, type_);
+            self._nodes[key] = node;
+        return node;
+
+    def intern(self, tree):
+        """ rebuild a tree so that structurally identical subtrees (also across trees from this parser) are one shared node """
+        canonical = {};
+        for node in get_ordered_nodes(tree):
+            if node.type == "tree":
+                subtrees = [canonical[id(subtree)] for subtree in node.subtrees];
+                canonical[id(node)] = self.__node(node.function, subtrees, node.name);
             else:
-                sub_list.append(token);
-        if sub_list: result.append(sub_list); # sub_list could be [] if there is only one argument
-        return result;
-
-    def get_lowest_precedence_token(self, tokens):
-        """ get the index of the token with lowest precedence in a list of tokens. -1 if no tokens have a precedence (terminal) """
-        lowest_index, lowest_precedence = -1, len(tokens) * PARENTHESIS_WEIGHT;
-        for i, token in enumerate(tokens):
-            if isinstance(token, (InfixFunction, PrefixFunction)):
-                if token.precedence < lowest_precedence:
-                    lowest_index = i;
-                    lowest_precedence = token.precedence;
-                elif (token.precedence == lowest_precedence and token.associativity == -1):
-                    lowest_index = i;
-                    lowest_precedence = token.precedence;
-        return lowest_index, tokens[lowest_index];
-
-    def get_unary_arguments(self, tokens, index):
-        """ get the arguments of a prefix function """
-        tokens, arglist, count = tokens[index+1:], [], 1;
-        for token in tokens:
-            if isinstance(token, OtherToken):
-                if token.value == "(": count += 1;
-                elif token.value == ")": count -= 1;
-                if not count:
-                    arglist.append(token);
-                    break;
-            arglist.append(token);
-        return self.get_arguments(arglist);
-
-    def __parse(self, weighted_tokens):
-        """ parses a list of tokens that have their precedences weighted by parentheses """
-        lowest_index, lowest_token = self.get_lowest_precedence_token(weighted_tokens);
-        if lowest_index == -1:
-            token = [tkn for tkn in weighted_tokens if not isinstance(tkn, OtherToken)][0];
-            type_ = "symbol" if isinstance(token, Symbol) else "number";
-            return ParseTree(None, None, token.value, type_);
-
-        if isinstance(lowest_token, InfixFunction):
-            l, r = self.__parse(weighted_tokens[:lowest_index]), self.__parse(weighted_tokens[lowest_index+1:]);
-            return ParseTree(lowest_token.value, [l, r], None);
-
-        elif isinstance(lowest_token, PrefixFunction):
-            zo = [self.__parse(argument) for argument in self.get_unary_arguments(weighted_tokens, lowest_index)];
-            return ParseTree(lowest_token.value, zo, None);
-
-    def parse(self, expression):
-        """ parses a mathematical expression into a ParseTree """
-        tokens, p_count = self._tokenizer.tokenize(expression), 0;
-
-        for token in tokens:
-            if isinstance(token, OtherToken):
-                if token.value == "(":
-                    p_count += 1;
-                elif token.value == ")":
-                    p_count -= 1;
-            elif isinstance(token, (InfixFunction, PrefixFunction)):
-                token.precedence += p_count * PARENTHESIS_WEIGHT;
-        return self.__parse(tokens);
-
-    def parse_equation(self, equation):
-        """ parses the left and right sides of an equation. Returns a ParseTree with all terms on the left """
+                canonical[id(node)] = self.__node(None, None, node.value, node.type);
+        return canonical[id(tree)];
+
+    def define_derivatives(self, **derivatives):
+        """ register derivatives of defined functions: name=partial, or name=(partial, ...) with one partial per argument """
+        for name, partials in derivatives.items():
+            if name not in self._tokenizer.functions:
+                raise UserError("Derivatives can only be defined for defined functions. Actual name: {}".format(name));
+            register_derivative(self._derivatives, self._tokenizer.functions[name], *(partials if isinstance(partials, tuple) else (partials,)));
+
+    def define_interval_rules(self, **rules):
+        """ register interval rules of defined functions: name=rule, where rule takes one (low, high) pair per argument and returns bounds on the result """
+        for name, rule in rules.items():
+            if name not in self._tokenizer.functions:
+                raise UserError("Interval rules can only be defined for defined functions. Actual name: {}".format(name));
+            register_interval_rule(self._interval_rules, self._tokenizer.functions[name], rule);
+
+    def __forget_rules(self):
+        """ drop the derivatives and interval rules of functions that are no longer defined """
+        defined = set(map(id, self._tokenizer.functions.values()));
+        for registry in (self._derivatives, self._interval_rules):
+            for function in [function for function in registry if id(function) not in defined]:
+                del registry[function];
+
+    def __bind(self, tree):
+        """ a root handed out by this parser, with its registries """
+        tree.derivatives, tree.interval_rules = self._derivatives, self._interval_rules;
+        return tree;
+
+    def cache_info(self):
+        """ hits, misses, maximum size and current size of the parse cache """
+        return self._cache.info();
+
+    def clear_cache(self):
+        """ empty the parse cache """
+        self._cache.clear();
+
+    def __cached(self, kind, expression, parse):
+        """ look up a parse result in the cache, parsing and storing it on a miss """
+        # the cache key also holds the tokenizer configuration, so a tokenizer changed directly never serves stale trees
+        key = (self._tokenizer.configuration, kind, self._tokenizer.normalize(expression));
+        tree = self._cache.get(key);
+        if tree is None:
+            tree = parse(expression);
+            self._cache.put(key, tree);
+        # subtrees are immutable tuples and can be shared. the root is copied so set_ordered_subs on one result does not affect another
+        return self.__bind(copy(tree));
+
+    def is_other_token(self, tokens, position, value):
+        """ whether the token at position is the OtherToken value ('(', ')' or ',') """
+        return position < len(tokens) and isinstance(tokens[position], OtherToken) and tokens[position].value == value;
+
+    def __parse_infix(self, left, tokens, position, minimum_precedence):
+        """ extends left with the infix operators that bind at least as tightly as minimum_precedence. returns (tree, next position) """
+        # equal precedences are handled by this loop rather than by recursion, so long sums do not nest deeper
+        while position < len(tokens):
+            token = tokens[position];
+            if not isinstance(token, InfixFunction) or token.precedence < minimum_precedence:
+                break;
+            next_minimum = token.precedence if token.associativity == -1 else token.precedence + 1;
+            right, position = self.__parse_expression(tokens, position + 1, next_minimum);
+            left = self.__node(token.value, [left, right], token.name);
+        return left, position;
+
+    def __parse_arguments(self, tokens, position):
+        """ parses a parenthesized, comma separated argument list starting at the '(' at position. returns (arguments, next position) """
+        arguments = [];
+        while True:
+            argument, position = self.__parse_expression(tokens, position + 1, 0);
+            arguments.append(argument);
+            if self.is_other_token(tokens, position, ")"):
+                return arguments, position + 1;
+            if not self.is_other_token(tokens, position, ARGUMENT_SEPARATOR):
+                raise UserError("Expected '{}' or ')' in argument list".format(ARGUMENT_SEPARATOR));
+
+    def __parse_operand(self, tokens, position):
+        """ parses a number, symbol, parenthesized expression or prefix function application. returns (tree, next position) """
+        if position >= len(tokens):
+            raise UserError("Unexpected end of expression");
+        token = tokens[position];
+
+        if isinstance(token, Symbol):
+            return self.__node(None, None, token.value, "symbol"), position + 1;
+        elif isinstance(token, Number):
+            return self.__node(None, None, token.value, "number"), position + 1;
+        elif isinstance(token, PrefixFunction):
+            if self.is_other_token(tokens, position + 1, "("):
+                arguments, position = self.__parse_arguments(tokens, position + 1);
+                if token.name == "~" and len(arguments) != 1:
+                    raise UserError("Negation takes one operand, not {}".format(len(arguments)));
+                if len(arguments) == 1:
+                    # operators that bind tighter than the function still apply to its argument: sin(x)^2 is sin(x^2)
+                    argument, position = self.__parse_infix(arguments[0], tokens, position, token.precedence + 1);
+                    arguments = [argument];
+            else:
+                argument, position = self.__parse_expression(tokens, position + 1, token.precedence + 1);
+                arguments = [argument];
+            return self.__node(token.value, arguments, token.name), position;
+        elif self.is_other_token(tokens, position, "("):
+            tree, position = self.__parse_expression(tokens, position + 1, 0);
+            if not self.is_other_token(tokens, position, ")"):
+                raise UserError("Missing closing parenthesis");
+            return tree, position + 1;
+        raise UserError("Unexpected token '{}'".format(token));
+
+    def __parse_expression(self, tokens, position, minimum_precedence):
+        """ operator precedence (Pratt) parser: parses an operand and the operators binding at least as tightly as minimum_precedence """
+        left, position = self.__parse_operand(tokens, position);
+        return self.__parse_infix(left, tokens, position, minimum_precedence);
+
+    def deserialize(self, data):
+        """ load a tree from ParseTree.serialize, binding its functions by name to this parser's functions """
+        # the nodes are shared with the parser's other trees, the root is copied like the results of parse
+        return self.__bind(copy(self.__deserialize_shared(data)));
+
+    def __deserialize_shared(self, data):
+        """ load a serialized tree as shared nodes, without copying the root """
+        return deserialize_tree(data, self._tokenizer.functions, self.__node);
+
+    def __cache_file(self, expression):
+        """ the file an expression is cached in inside cache_directory """
+        configuration, directory = self._configuration_directory;
+        if configuration != self._tokenizer.configuration:
+            directory = os.path.join(self.cache_directory, configuration_hash(self._tokenizer.functions.keys(), self._tokenizer.symbols));
+            self._configuration_directory = (self._tokenizer.configuration, directory);
+        return os.path.join(directory, expression_hash("expression", self._tokenizer.normalize(expression)));
+
+    def __load_cache_file(self, path):
+        """ load a tree from the cache directory. None if it is missing or unreadable """
+        try:
+            with open(path, "rb") as file:
+                return self.__deserialize_shared(file.read());
+        except (OSError, ValueError, TypeError, IndexError, KeyError, UserError):
+            # missing, corrupt or outdated entries are parsed again and rewritten
+            return None;
+
+    def __write_cache_file(self, path, tree):
+        """ store a tree in the cache directory. the file is replaced atomically so concurrent readers never see a partial file """
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True);
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+                file.write(tree.serialize());
+            os.replace(file.name, path);
+        except OSError:
+            pass; # the cache directory is an optimization, parsing works without it
+
+    def __parse_string(self, expression):
+        """ tokenizes and parses an expression, bypassing the in-memory cache """
+        path = self.__cache_file(expression) if self.cache_directory is not None else None;
+        if path is not None:
+            tree = self.__load_cache_file(path);
+            if tree is not None:
+                return tree;
+
+        tokens = self._tokenizer.tokenize(expression);
+        tree, position = self.__parse_expression(tokens, 0, 0);
+        if position != len(tokens):
+            raise UserError("Unexpected token '{}'".format(tokens[position]));
+
+        if path is not None:
+            self.__write_cache_file(path, tree);
+        return tree;
+
+    def __parse_equation_string(self, equation):
+        """ parses both sides of an equation, bypassing the cache """
         left, right = equation.split("=");
         left = self.parse(left);
         right = self.parse(right);
-        return Manipulator.move_all_terms_to_left(left, right);
+        return self.intern(Manipulator.move_all_terms_to_left(left, right));
+
+    def __simplified(self, parse):
+        """ wraps a parse function so that its result is simplified and re-interned """
+        return lambda expression: self.intern(Manipulator.simplify(parse(expression)));
+
+    def parse(self, expression, simplify=False):
+        """ parses a mathematical expression into a ParseTree. if simplify is True, constants are folded and identities applied (see Manipulator.simplify) """
+        if simplify:
+            return self.__cached("simplified expression", expression, self.__simplified(self.__parse_string));
+        return self.__cached("expression", expression, self.__parse_string);
+
+    def parse_many(self, expressions, workers=1, chunksize=None, simplify=False):
+        """ parse many expressions, on a process pool if workers is not 1 (None for one per core). returns (trees, errors): the trees in input order, None where parsing failed, and a dict of index: UserError """
+        if workers != 1:
+            from CAS.Parallel import parse_parallel;
+            return parse_parallel(self, expressions, workers, chunksize, simplify);
+        trees, errors = [], {};
+        for index, expression in enumerate(expressions):
+            try:
+                trees.append(self.parse(expression, simplify));
+            except UserError as error:
+                trees.append(None);
+                errors[index] = error;
+        return trees, errors;
+
+    def parse_equation(self, equation, simplify=False):
+        """ parses the left and right sides of an equation. Returns a ParseTree with all terms on the left """
+        if simplify:
+            return self.__cached("simplified equation", equation, self.__simplified(self.__parse_equation_string));
+        return self.__cached("equation", equation, self.__parse_equation_string);
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+from fractions import Fraction;
+from CAS.Errors import UserError;
+from CAS.data import OPERATIONS;
+from CAS.Tokenizer import perfect_ratio;
+from CAS import Parser;
+
+# Sparse polynomials with exact coefficients. A monomial is a sorted tuple of (symbol, exponent) pairs, () for the
+# constant term, and terms maps monomials to non-zero Fractions.
+# Evaluation uses a multivariate Horner scheme: the polynomial is written as a polynomial in its first symbol whose
+# coefficients are polynomials in the remaining symbols, recursively. A scheme is either (None, constant) or
+# (symbol, [(exponent, scheme), ...]) with the exponents decreasing.
+
+
+# expansions past these sizes raise UserError instead of hanging, e.g. on (x+1)^100000
+MAXIMUM_PRODUCT = 100000; # term pairs multiplied by one product
+MAXIMUM_DEGREE = 256; # total degree of a power of a polynomial with several terms
+
+
+def multiply_monomials(a, b):
+    """ the product of two monomials """
+    exponents = dict(a);
+    for symbol, exponent in b:
+        exponents[symbol] = exponents.get(symbol, 0) + exponent;
+    return tuple(sorted(exponents.items()));
+
+
+class Polynomial():
+
+    """ A polynomial in several symbols with exact Fraction coefficients """
+
+    def __init__(self, terms=None):
+        self.terms = {monomial: Fraction(coefficient) for monomial, coefficient in (terms or {}).items() if coefficient != 0};
+        self.scheme = None;
+
+    @staticmethod
+    def constant(value):
+        return Polynomial({(): perfect_ratio(value)});
+
+    @staticmethod
+    def symbol(name):
+        return Polynomial({((name, 1),): 1});
+
+    def is_constant(self):
+        return all(monomial == () for monomial in self.terms);
+
+    def constant_value(self):
+        """ the constant term """
+        return self.terms.get((), Fraction(0));
+
+    def get_symbols(self):
+        return {symbol for monomial in self.terms for symbol, exponent in monomial};
+
+    def degree(self):
+        """ the total degree. -1 for the zero polynomial """
+        return max((sum(exponent for symbol, exponent in monomial) for monomial in self.terms), default=-1);
+
+    def __eq__(self, other):
+        return isinstance(other, Polynomial) and self.terms == other.terms;
+
+    def __repr__(self):
+        if not self.terms:
+            return "0";
+        powers = lambda monomial: "".join("*{}".format(symbol) if exponent == 1 else "*{}^{}".format(symbol, exponent) for symbol, exponent in monomial);
+        return " + ".join("{}{}".format(coefficient, powers(monomial)) for monomial, coefficient in sorted(self.terms.items()));
+
+    def __add__(self, other):
+        terms = dict(self.terms);
+        for monomial, coefficient in other.terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coefficient;
+        return Polynomial(terms);
+
+    def add_in_place(self, other, sign=1):
+        """ add sign * other to this polynomial, changing it. used to build long sums without copying the terms at every step """
+        terms = self.terms;
+        for monomial, coefficient in other.terms.items():
+            value = terms.get(monomial, 0) + sign * coefficient;
+            if value:
+                terms[monomial] = value;
+            else:
+                terms.pop(monomial, None);
+        self.scheme = None;
+        return self;
+
+    def negate_in_place(self):
+        """ negate this polynomial, changing it """
+        for monomial in self.terms:
+            self.terms[monomial] = -self.terms[monomial];
+        self.scheme = None;
+        return self;
+
+    def __neg__(self):
+        return Polynomial({monomial: -coefficient for monomial, coefficient in self.terms.items()});
+
+    def __sub__(self, other):
+        return self + -other;
+
+    def __mul__(self, other):
+        if len(self.terms) * len(other.terms) > MAXIMUM_PRODUCT:
+            raise UserError("The product of polynomials with {} and {} terms is too large".format(len(self.terms), len(other.terms)));
+        terms = {};
+        for a, ca in self.terms.items():
+            for b, cb in other.terms.items():
+                monomial = multiply_monomials(a, b);
+                terms[monomial] = terms.get(monomial, 0) + ca * cb;
+        return Polynomial(terms);
+
+    def __pow__(self, exponent):
+        if not isinstance(exponent, int) or exponent < 0:
+            raise UserError("Polynomials can only be raised to non-negative integer powers. Actual exponent: {}".format(exponent));
+        if len(self.terms) > 1 and exponent * self.degree() > MAXIMUM_DEGREE:
+            raise UserError("The power of degree {} is too large to expand".format(exponent * self.degree()));
+        result, base = Polynomial.constant(1), self;
+        while exponent:
+            if exponent & 1:
+                result = result * base;
+            exponent >>= 1;
+            if exponent:
+                base = base * base;
+        return result;
+
+    def get_scheme(self):
+        """ the multivariate Horner scheme, computed once """
+        if self.scheme is None:
+            self.scheme = Polynomial.build_scheme(self.terms);
+        return self.scheme;
+
+    @staticmethod
+    def build_scheme(terms):
+        symbols = {symbol for monomial in terms for symbol, exponent in monomial};
+        if not symbols:
+            return (None, terms.get((), Fraction(0)));
+        symbol = min(symbols);
+        coefficients = {};
+        for monomial, coefficient in terms.items():
+            exponent = dict(monomial).get(symbol, 0);
+            rest = tuple(power for power in monomial if power[0] != symbol);
+            coefficients.setdefault(exponent, {})[rest] = coefficient;
+        return (symbol, [(exponent, Polynomial.build_scheme(coefficients[exponent])) for exponent in sorted(coefficients, reverse=True)]);
+
+    @staticmethod
+    def evaluate_scheme(scheme, substitutions):
+        symbol, terms = scheme;
+        if symbol is None:
+            return terms;
+        x = substitutions[symbol];
+        exponent, coefficient = terms[0];
+        result = Polynomial.evaluate_scheme(coefficient, substitutions);
+        for next_exponent, coefficient in terms[1:]:
+            result = result * x ** (exponent - next_exponent) + Polynomial.evaluate_scheme(coefficient, substitutions);
+            exponent = next_exponent;
+        return result * x ** exponent if exponent else result;
+
+    def evaluate(self, **substitutions):
+        """ evaluate with the Horner scheme. exact for Fraction and int values """
+        missing = self.get_symbols().difference(substitutions);
+        if missing:
+            raise UserError("No value was given for the symbols {}".format(tuple(sorted(missing))));
+        return Polynomial.evaluate_scheme(self.get_scheme(), substitutions);
+
+    @staticmethod
+    def scheme_source(scheme):
+        """ Python source of a scheme with float coefficients """
+        symbol, terms = scheme;
+        if symbol is None:
+            literal = repr(float(terms));
+            return "({})".format(literal) if literal.startswith("-") else literal;
+        exponent, coefficient = terms[0];
+        source = Polynomial.scheme_source(coefficient);
+        for next_exponent, coefficient in terms[1:]:
+            source = "({} * {} + {})".format(source, Polynomial.power_source(symbol, exponent - next_exponent), Polynomial.scheme_source(coefficient));
+            exponent = next_exponent;
+        return "{} * {}".format(source, Polynomial.power_source(symbol, exponent)) if exponent else source;
+
+    @staticmethod
+    def power_source(symbol, exponent):
+        return symbol if exponent == 1 else "{} ** {}".format(symbol, exponent);
+
+    def compile(self, symbols=None):
+        """ compile the Horner scheme into a function of positional arguments in symbols order (default: sorted). it evaluates in floats and works on numpy arrays too """
+        symbols = tuple(sorted(self.get_symbols()) if symbols is None else symbols);
+        missing = self.get_symbols().difference(symbols);
+        if missing:
+            raise UserError("The symbols {} are not in the ordered symbols {}".format(tuple(sorted(missing)), symbols));
+        source = "def compiled({}):\n    return {}".format(", ".join(symbols), Polynomial.scheme_source(self.get_scheme()));
+        namespace = {};
+        exec(compile(source, "<Polynomial>", "exec"), namespace);
+        function = namespace["compiled"];
+        function.source = source;
+        return function;
+
+    @staticmethod
+    def scheme_tree(scheme):
+        """ a ParseTree evaluating a scheme """
+        symbol, terms = scheme;
+        if symbol is None:
+            return Parser.ParseTree(None, None, terms, "number");
+        leaf = Parser.ParseTree(None, None, symbol, "symbol");
+        def power(exponent):
+            if exponent == 1:
+                return leaf;
+            return Parser.ParseTree(OPERATIONS["^"], (leaf, Parser.ParseTree(None, None, Fraction(exponent), "number")), "^");
+        def multiply(a, b):
+            if a.type == "number" and a.value == 1:
+                return b;
+            return Parser.ParseTree(OPERATIONS["*"], (a, b), "*");
+
+        exponent, coefficient = terms[0];
+        result = Polynomial.scheme_tree(coefficient);
+        for next_exponent, coefficient in terms[1:]:
+            result = Parser.ParseTree(OPERATIONS["+"], (multiply(result, power(exponent - next_exponent)), Polynomial.scheme_tree(coefficient)), "+");
+            exponent = next_exponent;
+        return multiply(result, power(exponent)) if exponent else result;
+
+    def to_tree(self):
+        """ a ParseTree of the Horner scheme """
+        return Polynomial.scheme_tree(self.get_scheme());
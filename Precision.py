@@ -0,0 +1,186 @@
+import math;
+from math import inf;
+from fractions import Fraction;
+from CAS.Errors import UserError;
+from CAS.data import OPERATIONS;
+from CAS.Cache import LRUCache;
+from CAS.Compiler import get_ordered_nodes;
+from CAS.Exact import exact_evaluate;
+from CAS.AutoDiff import get_partials;
+
+# Adaptive precision evaluation. A compiled float evaluation also computes a running bound on the absolute error of
+# every node (first order, from the errors of its arguments plus the rounding of the node itself). When the bound of
+# the result is too large relative to the result, e.g. after catastrophic cancellation, or when the float evaluation
+# fails where exact arithmetic might not, the tree is evaluated again with the exact engine (see evaluate_exact).
+
+UNIT_ROUNDOFF = 2.0 ** -53;
+DEFAULT_TOLERANCE = 1e-12; # relative error bound above which a float result is not trusted
+FUNCTION_ULPS = 2; # error of library functions, in units of roundoff of their result
+
+# compiled bounded evaluators, keyed by tree structure (see ParseTree.get_structure) and symbols, so that the copies
+# Parser returns for one expression share them. the functions of the tree are referenced by the evaluators
+COMPILED = LRUCache(1024);
+
+
+def input_value(x):
+    """ a substitution as (float, bound on the error of that float) """
+    value = float(x);
+    if type(x) is float or value == x:
+        return value, 0.0;
+    return value, abs(float(Fraction(x) - Fraction(value))) + UNIT_ROUNDOFF * abs(value);
+
+
+def rounding(t):
+    return UNIT_ROUNDOFF * abs(t);
+
+
+def multiply_error(a, ea, b, eb, t):
+    return abs(a) * eb + abs(b) * ea + ea * eb + rounding(t);
+
+
+def divide_error(a, ea, b, eb, t):
+    if eb >= abs(b):
+        return inf; # the divisor could be zero
+    return (ea + abs(t) * eb) / (abs(b) - eb) + rounding(t);
+
+
+def modulo_error(a, ea, b, eb, t):
+    # the result jumps where a / b crosses an integer, so only exact arguments give a trustworthy result
+    return rounding(t) if ea == 0 and eb == 0 else inf;
+
+
+def power_error(a, ea, b, eb, t):
+    if isinstance(t, complex):
+        raise ValueError("a negative number cannot be raised to a fractional power");
+    error = FUNCTION_ULPS * rounding(t);
+    if ea == 0 and eb == 0:
+        return error;
+    try:
+        if eb == 0 and b == int(b):
+            n, base = int(b), abs(a);
+            if n >= 0:
+                return error + (base + ea) ** n - base ** n;
+            if ea >= base:
+                return inf;
+            return error + (base - ea) ** n - base ** n;
+        if a - ea <= 0:
+            return inf;
+        # |d(a^b)/da| ea + |d(a^b)/db| eb, with the derivative in a bounded over [a - ea, a + ea]
+        return error + 2 * abs(t) * (abs(b) * ea / (a - ea) + abs(math.log(a)) * eb);
+    except OverflowError:
+        return inf;
+
+
+def function_error(partials, arguments, errors, t):
+    """ the error of a function with known partial derivatives: first order propagation, with a factor 2 of margin """
+    error = FUNCTION_ULPS * rounding(t);
+    for partial, argument, argument_error in zip(partials, arguments, errors):
+        if argument_error:
+            try:
+                error += 2 * abs(partial(*arguments)) * argument_error;
+            except (ZeroDivisionError, ValueError, OverflowError):
+                return inf;
+    return error;
+
+
+def unknown_error(errors, t):
+    """ the error of a function nothing is known about: only trusted when its arguments are exact """
+    return FUNCTION_ULPS * rounding(t) if not any(errors) else inf;
+
+
+OPERATION_ERRORS = {
+    "+": "{e0} + {e1} + _rounding({t})",
+    "-": "{e0} + {e1} + _rounding({t})",
+    "*": "_multiply_error({a0}, {e0}, {a1}, {e1}, {t})",
+    "/": "_divide_error({a0}, {e0}, {a1}, {e1}, {t})",
+    "%": "_modulo_error({a0}, {e0}, {a1}, {e1}, {t})",
+    "^": "_power_error({a0}, {e0}, {a1}, {e1}, {t})",
+    "~": "{e0}"
+};
+
+OPERATION_VALUES = {
+    "+": "{a0} + {a1}",
+    "-": "{a0} - {a1}",
+    "*": "{a0} * {a1}",
+    "/": "{a0} / {a1}",
+    "%": "{a0} % {a1}",
+    "^": "{a0} ** {a1}",
+    "~": "-{a0}"
+};
+
+
+def generate_source(tree, symbols, derivatives=None):
+    """ the source of a function returning (float value, error bound) of tree, and the namespace it must be executed in """
+    namespace = {
+        "_input": input_value, "_rounding": rounding, "_multiply_error": multiply_error, "_divide_error": divide_error,
+        "_modulo_error": modulo_error, "_power_error": power_error, "_function_error": function_error, "_unknown_error": unknown_error
+    };
+    body = ["{0}, {0}_e = _input({0})".format(symbol) for symbol in symbols];
+    names = {};
+    for node in get_ordered_nodes(tree):
+        if node.type == "symbol":
+            if node.value not in symbols:
+                raise UserError("Symbol '{}' is not one of the ordered symbols {}".format(node.value, tuple(symbols)));
+            names[id(node)] = node.value;
+            continue;
+        name = "_t{}".format(len(names));
+        names[id(node)] = name;
+        if node.type == "number":
+            namespace[name], namespace[name + "_e"] = input_value(node.value);
+            continue;
+        arguments = [names[id(subtree)] for subtree in node.subtrees];
+        errors = [argument + "_e" for argument in arguments];
+        fields = {"t": name};
+        fields.update({"a{}".format(i): argument for i, argument in enumerate(arguments)});
+        fields.update({"e{}".format(i): error for i, error in enumerate(errors)});
+        operation = getattr(node, "name", None);
+        if operation in OPERATIONS and node.function is OPERATIONS[operation]:
+            body.append("{} = {}".format(name, OPERATION_VALUES[operation].format(**fields)));
+            body.append("{}_e = {}".format(name, OPERATION_ERRORS[operation].format(**fields)));
+            continue;
+        function = "_f{}".format(len(namespace));
+        namespace[function] = node.function;
+        body.append("{} = {}({})".format(name, function, ", ".join(arguments)));
+        partials = get_partials(node.function, math, None, derivatives);
+        if partials is not None and len(partials) >= len(arguments):
+            namespace[function + "_d"] = partials;
+            body.append("{0}_e = _function_error({1}_d, ({2},), ({3},), {0})".format(name, function, ", ".join(arguments), ", ".join(errors)));
+        else:
+            body.append("{0}_e = _unknown_error(({1},), {0})".format(name, ", ".join(errors)));
+    result = names[id(tree)];
+    lines = ["def bounded({}):".format(", ".join(symbols))];
+    lines += ["    " + line for line in body];
+    lines.append("    return {0}, {0}_e".format(result));
+    return "\n".join(lines), namespace;
+
+
+def compile_bounded(tree):
+    """ compile tree into a function of its ordered symbols returning (float value, error bound). computed once per tree structure """
+    symbols, derivatives = tree.get_ordered_symbols(), getattr(tree, "derivatives", None);
+    # the registered derivatives are part of the key, so trees from parsers with different derivatives do not share functions
+    key = (tree.get_structure(), symbols, tuple(derivatives.items()) if derivatives else ());
+    compiled = COMPILED.get(key);
+    if compiled is None:
+        source, namespace = generate_source(tree, symbols, derivatives);
+        exec(compile(source, "<ParseTree:bounded>", "exec"), namespace);
+        function = namespace["bounded"];
+        function.source = source;
+        compiled = (function, symbols);
+        COMPILED.put(key, compiled);
+    return compiled;
+
+
+def adaptive_evaluate(tree, substitutions, tolerance=DEFAULT_TOLERANCE):
+    """ evaluate in floats, falling back to exact arithmetic when the error bound relative to the result is above tolerance. returns a float """
+    function, symbols = compile_bounded(tree);
+    try:
+        arguments = [substitutions[symbol] for symbol in symbols];
+    except KeyError as error:
+        raise UserError("No value was given for the symbol {}".format(error)) from None;
+    try:
+        value, error = function(*arguments);
+        if error <= tolerance * abs(value):
+            return value;
+    except (ZeroDivisionError, ValueError, OverflowError):
+        pass; # the float evaluation may have failed because of rounding, the exact engine decides
+    return float(exact_evaluate(tree.get_ordered_nodes(), substitutions));
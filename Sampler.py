@@ -0,0 +1,97 @@
+from math import inf;
+from CAS.Errors import UserError, EvaluationError;
+from CAS.Compiler import compile_tree;
+from CAS.Interval import interval_evaluate;
+
+# Adaptive sampling for plotting. Intervals are split only while interval arithmetic cannot prove that the expression
+# varies by less than the tolerance over them, so flat regions cost a few evaluations and poles are found however
+# narrow they are.
+
+
+def point_function(tree, symbols, fixed):
+    """ a float function of the varying symbols, with the fixed symbols bound. None where the expression is undefined """
+    function = compile_tree(tree, tuple(symbols) + tuple(fixed), "float");
+    values = tuple(fixed.values());
+    def evaluate(*arguments):
+        try:
+            return float(function(*arguments, *values));
+        except (EvaluationError, TypeError): # TypeError: a defined function returned a complex number
+            return None;
+    return evaluate;
+
+
+def diverges(f, a, b, tolerance, steps=8):
+    """ whether the sampled values of f look discontinuous on [a, b]: undefined at a sample, or a jump above tolerance that bisecting towards it does not shrink """
+    fa, fb = f(a), f(b);
+    if fa is None or fb is None:
+        return True;
+    jump = abs(fb - fa);
+    if jump <= tolerance:
+        return False;
+    for step in range(steps):
+        middle = (a + b) / 2;
+        fm = f(middle);
+        if fm is None:
+            return True;
+        if abs(fm - fa) >= abs(fb - fm):
+            b, fb = middle, fm;
+        else:
+            a, fa = middle, fm;
+    # the jump of a continuous function about halves at every step
+    return abs(fb - fa) > max(tolerance, jump / 4);
+
+
+def check_depths(min_depth, max_depth):
+    if not isinstance(max_depth, int) or not isinstance(min_depth, int) or not 0 <= min_depth <= max_depth:
+        raise UserError("Depths must be integers with 0 <= min_depth <= max_depth. Actual depths: {}, {}".format(min_depth, max_depth));
+
+
+def sample_curve(tree, symbol, low, high, tolerance, max_depth=12, min_depth=2, **fixed):
+    """ sample tree as a function of symbol over [low, high], keeping the variation over every piece within tolerance where possible. returns (x, y) points in order, with y None to break the curve (undefined parts and poles) """
+    check_depths(min_depth, max_depth);
+    nodes, f, rules = tree.get_ordered_nodes(), point_function(tree, (symbol,), fixed), getattr(tree, "interval_rules", None);
+    points, stack = [], [(low, high, 0)];
+    while stack:
+        a, b, depth = stack.pop();
+        poles = [];
+        bounds = interval_evaluate(nodes, dict(fixed, **{symbol: (a, b)}), poles, rules);
+        if bounds is None:
+            points.append((a, None));
+            continue;
+        flat = bounds[1] - bounds[0] <= tolerance;
+        if (flat and depth >= min_depth) or depth >= max_depth:
+            fa = f(a);
+            points.append((a, fa));
+            if bounds[0] == -inf or bounds[1] == inf:
+                if poles:
+                    # a rule found a possible pole: a jump over the smallest piece is taken to be one
+                    fb = f(b);
+                    is_pole = fa is None or fb is None or abs(fb - fa) > tolerance;
+                else:
+                    # unbounded because some function has no interval rule: only the sampled values can show a pole
+                    is_pole = diverges(f, a, b, tolerance);
+                if is_pole:
+                    points.append(((a + b) / 2, None));
+            continue;
+        middle = (a + b) / 2;
+        stack.append((middle, b, depth + 1));
+        stack.append((a, middle, depth + 1));
+    points.append((high, f(high)));
+    return points;
+
+
+def sample_implicit(tree, x_symbol, y_symbol, x_range, y_range, resolution, max_depth=10, min_depth=2, **fixed):
+    """ the cells (x_low, x_high, y_low, y_high) of the region that may contain the curve tree = 0 (e.g. a tree from parse_equation), subdivided until they are at most resolution wide or max_depth is reached """
+    check_depths(min_depth, max_depth);
+    nodes, cells, stack, rules = tree.get_ordered_nodes(), [], [(tuple(x_range), tuple(y_range), 0)], getattr(tree, "interval_rules", None);
+    while stack:
+        (x0, x1), (y0, y1), depth = stack.pop();
+        bounds = interval_evaluate(nodes, dict(fixed, **{x_symbol: (x0, x1), y_symbol: (y0, y1)}), None, rules);
+        if bounds is None or not bounds[0] <= 0 <= bounds[1]:
+            continue; # the curve does not pass through this cell
+        if depth >= max_depth or (depth >= min_depth and x1 - x0 <= resolution and y1 - y0 <= resolution):
+            cells.append((x0, x1, y0, y1));
+            continue;
+        xm, ym = (x0 + x1) / 2, (y0 + y1) / 2;
+        stack.extend([((x0, xm), (y0, ym), depth + 1), ((xm, x1), (y0, ym), depth + 1), ((x0, xm), (ym, y1), depth + 1), ((xm, x1), (ym, y1), depth + 1)]);
+    return cells;
@@ -0,0 +1,73 @@
+import json;
+import hashlib;
+from fractions import Fraction;
+from CAS.Errors import UserError;
+from CAS.Compiler import get_ordered_nodes;
+from CAS.data import OPERATIONS;
+
+# A serialized tree is a JSON [version, instructions, constants, names] list (JSON rather than pickle, so loading a cache file
+# cannot run code). instructions is a flat int array holding the
+# distinct nodes in post-order, each one as: NUMBER constant | SYMBOL name | OPERATION name arity child... | CALL name arity child...
+# where names and constants index the pools and children index earlier nodes, so shared subtrees are stored once.
+# Operators and functions are stored by name and bound again when the tree is loaded.
+
+FORMAT_VERSION = 1;
+NUMBER, SYMBOL, OPERATION, CALL = range(4);
+
+
+def serialize_tree(tree):
+    """ a compact bytes representation of a tree that refers to operators and functions by name """
+    instructions, constants, names, slots = [], {}, {}, {};
+    for slot, node in enumerate(get_ordered_nodes(tree)):
+        slots[id(node)] = slot;
+        if node.type == "number":
+            instructions.extend((NUMBER, constants.setdefault((node.value.numerator, node.value.denominator), len(constants))));
+        elif node.type == "symbol":
+            instructions.extend((SYMBOL, names.setdefault(node.value, len(names))));
+        else:
+            name = getattr(node, "name", None);
+            if not isinstance(name, str):
+                raise UserError("Only trees whose functions are named can be serialized");
+            opcode = OPERATION if name in OPERATIONS and node.function is OPERATIONS[name] else CALL;
+            instructions.extend((opcode, names.setdefault(name, len(names)), len(node.subtrees)));
+            instructions.extend(slots[id(subtree)] for subtree in node.subtrees);
+    return json.dumps([FORMAT_VERSION, instructions, list(constants), list(names)], separators=(",", ":")).encode();
+
+
+def deserialize_tree(data, functions, make_node):
+    """ rebuild a serialized tree, binding function names with the dict functions. make_node(function, subtrees, value, type_) creates the nodes """
+    version, instructions, constants, names = json.loads(data);
+    if version != FORMAT_VERSION:
+        raise UserError("Unsupported serialized tree version {}. Expected {}".format(version, FORMAT_VERSION));
+
+    nodes, position = [], 0;
+    while position < len(instructions):
+        opcode, operand = instructions[position], instructions[position + 1];
+        position += 2;
+        if opcode == NUMBER:
+            nodes.append(make_node(None, None, Fraction(*constants[operand]), "number"));
+        elif opcode == SYMBOL:
+            nodes.append(make_node(None, None, names[operand], "symbol"));
+        else:
+            name, arity = names[operand], instructions[position];
+            subtrees = [nodes[slot] for slot in instructions[position + 1:position + 1 + arity]];
+            position += 1 + arity;
+            if opcode == OPERATION:
+                function = OPERATIONS[name];
+            elif name in functions:
+                function = functions[name];
+            else:
+                raise UserError("The serialized tree uses the function '{}', which is not defined".format(name));
+            nodes.append(make_node(function, subtrees, name));
+    return nodes[-1];
+
+
+def configuration_hash(function_names, symbols):
+    """ identifies the function names and symbols a tree was parsed with. trees are bound to functions by name, so the functions themselves do not matter """
+    description = repr((FORMAT_VERSION, sorted(function_names), sorted(symbols)));
+    return hashlib.sha256(description.encode()).hexdigest()[:32];
+
+
+def expression_hash(kind, expression):
+    """ the file name a normalized expression is cached under """
+    return hashlib.sha256("{}:{}".format(kind, expression).encode()).hexdigest();
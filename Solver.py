@@ -0,0 +1,169 @@
+import numpy as np;
+from collections import namedtuple;
+from CAS.Errors import UserError;
+from CAS.Vectorize import batch_evaluate;
+from CAS.AutoDiff import batch_evaluate_with_gradient;
+
+# Root finding over many instances at once. Every instance is an element of the broadcast of the parameters and the
+# bracket/initial guess. Each iteration only evaluates the instances that are still active.
+
+SolveResult = namedtuple("SolveResult", ["root", "converged", "iterations"]);
+
+EPSILON = np.finfo(float).eps;
+METHODS = ("newton", "bisect", "brent");
+
+
+class Instances():
+
+    """ the flattened parameters of a batch of instances, for evaluating a tree at a subset of them """
+
+    def __init__(self, tree, symbol, parameters, shape):
+        self.tree, self.symbol, self.shape = tree, symbol, shape;
+        self.nodes, self.derivatives = tree.get_ordered_nodes(), getattr(tree, "derivatives", None);
+        self.parameters = {name: np.broadcast_to(np.asarray(value, dtype=float), shape).ravel() for name, value in parameters.items()};
+
+    def substitutions(self, x, indices):
+        substitutions = {name: value[indices] for name, value in self.parameters.items()};
+        substitutions[self.symbol] = x;
+        return substitutions;
+
+    def evaluate(self, x, indices):
+        """ f at x for the instances at indices """
+        return batch_evaluate(self.tree, self.substitutions(x, indices))[0];
+
+    def evaluate_with_derivative(self, x, indices):
+        """ f and df/dsymbol at x for the instances at indices """
+        value, gradient, mask = batch_evaluate_with_gradient(self.nodes, self.substitutions(x, indices), (self.symbol,), self.derivatives);
+        return value, gradient[self.symbol];
+
+
+def newton(instances, x, tolerance, max_iterations):
+    """ vectorized Newton iteration from the initial guesses x """
+    size = x.size;
+    converged, iterations = np.zeros(size, dtype=bool), np.zeros(size, dtype=int);
+    active = np.arange(size);
+    with np.errstate(all="ignore"):
+        for iteration in range(1, max_iterations + 1):
+            if not active.size:
+                break;
+            value, derivative = instances.evaluate_with_derivative(x[active], active);
+            step = value / derivative;
+            iterations[active] = iteration;
+            failed = ~np.isfinite(step);
+            x[active] = np.where(failed, x[active], x[active] - step);
+            done = (value == 0) | (np.abs(step) <= tolerance * (1 + np.abs(x[active])));
+            converged[active[done & ~failed]] = True;
+            active = active[~(done | failed)];
+    x[~converged] = np.nan;
+    return x, converged, iterations;
+
+
+def check_bracket(instances, a, b):
+    """ evaluate the bracket ends. returns fa, fb and the instances whose bracket contains a sign change """
+    indices = np.arange(a.size);
+    fa, fb = instances.evaluate(a, indices), instances.evaluate(b, indices);
+    return fa, fb, np.flatnonzero(np.sign(fa) * np.sign(fb) <= 0);
+
+
+def bisect(instances, a, b, tolerance, max_iterations):
+    """ vectorized bisection on the brackets [a, b] """
+    size = a.size;
+    root, converged, iterations = np.full(size, np.nan), np.zeros(size, dtype=bool), np.zeros(size, dtype=int);
+    with np.errstate(all="ignore"):
+        fa, fb, active = check_bracket(instances, a, b);
+        for iteration in range(1, max_iterations + 1):
+            if not active.size:
+                break;
+            middle = (a[active] + b[active]) / 2;
+            fm = instances.evaluate(middle, active);
+            iterations[active] = iteration;
+            left = np.sign(fa[active]) * np.sign(fm) <= 0;
+            b[active] = np.where(left, middle, b[active]);
+            a[active] = np.where(left, a[active], middle);
+            fa[active] = np.where(left, fa[active], fm);
+            done = (fm == 0) | (np.abs(b[active] - a[active]) <= 2 * tolerance * (1 + np.abs(middle)));
+            root[active[done]] = np.where(fm == 0, middle, (a[active] + b[active]) / 2)[done];
+            converged[active[done]] = True;
+            active = active[~done & np.isfinite(fm)];
+    return root, converged, iterations;
+
+
+def brent(instances, a, b, tolerance, max_iterations):
+    """ vectorized Brent's method (inverse quadratic interpolation, secant and bisection) on the brackets [a, b] """
+    size = a.size;
+    root, converged, iterations = np.full(size, np.nan), np.zeros(size, dtype=bool), np.zeros(size, dtype=int);
+    with np.errstate(all="ignore"):
+        fa, fb, active = check_bracket(instances, a, b);
+        c, fc = b.copy(), fb.copy();
+        d = b - a;
+        e = d.copy();
+        for iteration in range(1, max_iterations + 1):
+            if not active.size:
+                break;
+            iterations[active] = iteration;
+            A, B, C, FA, FB, FC, D, E = a[active], b[active], c[active], fa[active], fb[active], fc[active], d[active], e[active];
+
+            # keep the root between b and c
+            same_sign = np.sign(FB) == np.sign(FC);
+            C, FC = np.where(same_sign, A, C), np.where(same_sign, FA, FC);
+            D = E = np.where(same_sign, B - A, D);
+            # make b the best estimate
+            swap = np.abs(FC) < np.abs(FB);
+            A, FA = np.where(swap, B, A), np.where(swap, FB, FA);
+            B, FB = np.where(swap, C, B), np.where(swap, FC, FB);
+            C, FC = np.where(swap, A, C), np.where(swap, FA, FC);
+
+            tolerance1 = 2 * EPSILON * np.abs(B) + tolerance / 2;
+            middle = (C - B) / 2;
+            done = (np.abs(middle) <= tolerance1) | (FB == 0);
+
+            # interpolation step: secant when a == c, inverse quadratic otherwise
+            s = FB / FA;
+            q, r = FA / FC, FB / FC;
+            secant = A == C;
+            P = np.where(secant, 2 * middle * s, s * (2 * middle * q * (q - r) - (B - A) * (r - 1)));
+            Q = np.where(secant, 1 - s, (q - 1) * (r - 1) * (s - 1));
+            Q = np.where(P > 0, -Q, Q);
+            P = np.abs(P);
+            interpolate = (np.abs(E) >= tolerance1) & (np.abs(FA) > np.abs(FB));
+            accept = interpolate & (2 * P < np.minimum(3 * middle * Q - np.abs(tolerance1 * Q), np.abs(E * Q)));
+            E = np.where(accept, D, middle);
+            D = np.where(accept, P / Q, middle);
+
+            A, FA = B, FB;
+            B = np.where(np.abs(D) > tolerance1, B + D, B + np.where(middle >= 0, tolerance1, -tolerance1));
+            B = np.where(done, A, B);
+            evaluate = ~done;
+            FB = FA.copy();
+            FB[evaluate] = instances.evaluate(B[evaluate], active[evaluate]);
+
+            a[active], b[active], c[active], fa[active], fb[active], fc[active], d[active], e[active] = A, B, C, FA, FB, FC, D, E;
+            root[active[done]] = B[done];
+            converged[active[done]] = True;
+            active = active[~done & np.isfinite(FB)];
+    return root, converged, iterations;
+
+
+def solve(tree, symbol, bracket=None, initial=None, method=None, tolerance=1e-12, max_iterations=100, **parameters):
+    """ find a root of tree in symbol for every instance of the parameters. returns a SolveResult of arrays shaped like the broadcast instances """
+    if method is None:
+        method = "brent" if bracket is not None else "newton";
+    if method not in METHODS:
+        raise UserError("The solving method must be one of {}. Actual method: {}".format(METHODS, method));
+    if method == "newton" and initial is None:
+        raise UserError("Newton's method needs initial guesses");
+    if method != "newton" and bracket is None:
+        raise UserError("The {} method needs a bracket (low, high)".format(method));
+
+    guesses = [np.asarray(initial, dtype=float)] if method == "newton" else [np.asarray(end, dtype=float) for end in bracket];
+    shape = np.broadcast_shapes(*[guess.shape for guess in guesses], *(np.shape(value) for value in parameters.values()));
+    instances = Instances(tree, symbol, parameters, shape);
+    guesses = [np.array(np.broadcast_to(guess, shape)).ravel() for guess in guesses];
+
+    if method == "newton":
+        root, converged, iterations = newton(instances, guesses[0], tolerance, max_iterations);
+    elif method == "bisect":
+        root, converged, iterations = bisect(instances, *guesses, tolerance, max_iterations);
+    else:
+        root, converged, iterations = brent(instances, *guesses, tolerance, max_iterations);
+    return SolveResult(root.reshape(shape), converged.reshape(shape), iterations.reshape(shape));
@@ -0,0 +1,119 @@
+import csv;
+from itertools import islice;
+from CAS.Errors import UserError, EvaluationError;
+from CAS.Compiler import compile_tree;
+
+# Lazy evaluation of trees over row sources that may not fit in memory. Rows are pulled chunk_size at a time and
+# results are yielded as they are computed, so at most one chunk of input is held at once. Rows are dicts, or tuples in symbol order.
+# With numpy, each chunk is evaluated at once with batch_evaluate, and only the rows it could not evaluate are retried one
+# at a time, so errors are reported (or ignored) exactly as without numpy.
+
+ERROR_MODES = ("raise", "ignore");
+
+
+def csv_rows(path, symbols=None, chunk_size=4096, **options):
+    """ the rows of a CSV file with a header line, as tuples of floats in symbols order (default: the header order). options are passed to csv.reader """
+    with open(path, newline="") as file:
+        reader = csv.reader(file, **options);
+        header = next(reader, None);
+        if header is None:
+            return;
+        header = [name.strip() for name in header];
+        symbols = header if symbols is None else symbols;
+        try:
+            columns = [header.index(symbol) for symbol in symbols];
+        except ValueError:
+            raise UserError("The CSV file {} has no column for every symbol of {}. Columns: {}".format(path, tuple(symbols), tuple(header))) from None;
+        while True:
+            chunk = list(islice(reader, chunk_size));
+            if not chunk:
+                return;
+            for row in chunk:
+                yield tuple(float(row[column]) for column in columns);
+
+
+def binary_rows(path, symbols, dtype="float64", chunk_size=65536):
+    """ the rows of a raw binary file of row-major records with one value per symbol, memory mapped and read chunk by chunk. requires numpy """
+    import numpy as np;
+    data = np.memmap(path, dtype=dtype, mode="r");
+    if data.size % len(symbols):
+        raise UserError("The binary file {} does not hold a whole number of rows of {} values".format(path, len(symbols)));
+    data = data.reshape(-1, len(symbols));
+    for start in range(0, data.shape[0], chunk_size):
+        yield from map(tuple, data[start:start + chunk_size].tolist());
+
+
+def evaluate_stream(trees, rows, chunk_size=1024, symbols=None, errors="raise"):
+    """ evaluate several trees in one pass over rows, yielding a tuple with one float per tree for every row. tuple rows are in symbols order (default: set_ordered_subs of the first tree, or every symbol sorted). errors is 'raise', or 'ignore' to yield None for failed evaluations """
+    if errors not in ERROR_MODES:
+        raise UserError("errors must be one of {}. Actual value: {}".format(ERROR_MODES, errors));
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise UserError("The chunk size must be a positive integer. Actual value: {}".format(chunk_size));
+    trees = tuple(trees);
+    if symbols is None:
+        first = trees[0] if trees else None;
+        symbols = tuple(first.valid_symbols) if hasattr(first, "valid_symbols") else tuple(sorted(set().union(*(tree.get_symbols() for tree in trees))));
+    functions = [compile_tree(tree, symbols, "float") for tree in trees];
+
+    try:
+        from CAS.Vectorize import batch_evaluate;
+    except ImportError: # numpy is not installed: every row is evaluated on its own
+        batch_evaluate = None;
+
+    iterator, index, width = iter(rows), 0, len(symbols);
+    while True:
+        chunk = list(islice(iterator, chunk_size));
+        if not chunk:
+            return;
+        chunk = [row if type(row) is tuple and len(row) == width else row_values(row, symbols, index + offset) for offset, row in enumerate(chunk)];
+        columns = None if batch_evaluate is None or not trees else chunk_columns(trees, chunk, symbols, batch_evaluate);
+        if columns is None:
+            yield from (evaluate_row(functions, row, errors, index + offset) for offset, row in enumerate(chunk));
+        elif columns[1]:
+            # the rows batch_evaluate could not evaluate are retried one at a time, for their exact values or errors
+            failed = set(columns[1]);
+            yield from (evaluate_row(functions, chunk[offset], errors, index + offset) if offset in failed else values for offset, values in enumerate(zip(*columns[0])));
+        else:
+            yield from zip(*columns[0]);
+        index += len(chunk);
+
+
+def evaluate_row(functions, row, errors, index):
+    """ the values of the compiled functions at one row, which is row index of the stream """
+    values = [];
+    for function in functions:
+        try:
+            values.append(function(*row));
+        except EvaluationError as error:
+            if errors == "raise":
+                raise EvaluationError("{} (row {})".format(error, index)) from None;
+            values.append(None);
+    return tuple(values);
+
+
+def row_values(row, symbols, index):
+    """ the values of a dict or tuple row in symbols order """
+    if isinstance(row, dict):
+        try:
+            return [row[symbol] for symbol in symbols];
+        except KeyError as error:
+            raise UserError("Row {} has no value for the symbol {}".format(index, error)) from None;
+    if len(row) != len(symbols):
+        raise UserError("Row {} has {} values but there are {} symbols {}".format(index, len(row), len(symbols), symbols));
+    return row;
+
+
+def chunk_columns(trees, chunk, symbols, batch_evaluate):
+    """ the values of every tree over the rows of a chunk as lists, from one batch_evaluate per tree, and the offsets of the rows that failed for some tree. None if the rows are not all real numbers """
+    import numpy as np;
+    try:
+        data = np.array(chunk, dtype=float).reshape(len(chunk), len(symbols));
+    except (TypeError, ValueError): # e.g. complex values, which only evaluating row by row handles
+        return None;
+    substitutions = {symbol: data[:, column] for column, symbol in enumerate(symbols)};
+    values, failed = [], np.zeros(len(chunk), dtype=bool);
+    for tree in trees:
+        result, mask = batch_evaluate(tree, substitutions);
+        values.append(np.broadcast_to(result, (len(chunk),)).tolist());
+        failed |= mask;
+    return values, np.flatnonzero(failed).tolist();
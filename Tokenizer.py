@@ -1,7 +1,8 @@
 from fractions import Fraction;
 from CAS.Errors import UserError, InternalError;
-from CAS.data import OPERATORS, CONSTANTS, OPERATIONS, VALID_SYMBOLS, PRECEDENCES;
+from CAS.data import OPERATORS, CONSTANTS, OPERATIONS, VALID_SYMBOLS, PRECEDENCES, ARGUMENT_SEPARATOR;
 from math import sin, exp, gcd;
+import re;
 from pprint import pprint;
 
 
@@ -11,13 +12,11 @@ ts2 = "e + exp(A/(a+3))";
 
 def perfect_ratio(flt):
     """ return a fraction that PERFECTLY represents a float. the fractions module still falls victim to floating point errors (although it will reduce the fraction) """
-    if isinstance(flt, (int, float)):
-        str_flt = str(flt);
-        if not "." in str_flt:
-            return Fraction(int(flt), 1);
-        else:
-            mag = 10 ** len(str_flt.split(".")[1]);
-            return Fraction(int(flt * mag), int(mag));
+    if isinstance(flt, int):
+        return Fraction(flt, 1);
+    elif isinstance(flt, float):
+        # the shortest decimal representation of the float, read exactly
+        return Fraction(repr(flt));
     elif isinstance(flt, Fraction):
         return flt;
     else:
@@ -28,8 +27,11 @@ class Number():
 
     """ A number in an expression """
 
-    def __init__(self, value):
+    __slots__ = ("value", "span");
+
+    def __init__(self, value, span=None):
         self.value = perfect_ratio(value);
+        self.span = span;
 
     def __repr__(self):
         return "{}".format(self.value);
@@ -39,8 +41,11 @@ class Symbol():
 
     """ A symbol (variable) in an expression """
 
-    def __init__(self, value):
+    __slots__ = ("value", "span");
+
+    def __init__(self, value, span=None):
         self.value = value;
+        self.span = span;
 
     def __repr__(self):
         return self.value;
@@ -50,11 +55,14 @@ class InfixFunction():
 
     """ An infix function (a function that is between its two arguments) """
 
-    def __init__(self, name, value):
+    __slots__ = ("name", "value", "precedence", "associativity", "span");
+
+    def __init__(self, name, value, span=None):
         self.name = name;
         self.value = value;
         self.precedence = PRECEDENCES[name];
         self.associativity = -1 if self.name == "^" else 1;
+        self.span = span;
 
     def __repr__(self):
         return self.name;
@@ -64,10 +72,13 @@ class PrefixFunction():
 
     """ A prefix function (a function that is before its arbitrary number of arguments) """
 
-    def __init__(self, name, value):
+    __slots__ = ("name", "value", "precedence", "span");
+
+    def __init__(self, name, value, span=None):
         self.name = name;
         self.value = value;
         self.precedence = 3;
+        self.span = span;
 
     def __repr__(self):
         return self.name;
@@ -77,8 +88,11 @@ class OtherToken():
 
     """ Another token in an expression: (, ), or ,. """
 
-    def __init__(self, value):
+    __slots__ = ("value", "span");
+
+    def __init__(self, value, span=None):
         self.value = value;
+        self.span = span;
 
     def __repr__(self):
         return self.value;
@@ -96,6 +110,7 @@ class Tokenizer():
         self._symbols = defined_symbols;
         self.get_function_names();
         self.get_valid_characters();
+        self.compile_scanner();
 
     def __repr__(self):
         return "Tokenizer(\n\t Defined functions: {}\n\t Defined symbols: {}\n\t Legal Characters: {}\n)".format(self._functions, self._symbols, self._valid_characters);
@@ -112,6 +127,7 @@ class Tokenizer():
         self._functions = function_dict;
         self.get_function_names();
         self.get_valid_characters();
+        self.compile_scanner();
 
     @property
     def symbols(self):
@@ -124,6 +140,7 @@ class Tokenizer():
         self.test_symbol_list(symbol_list);
         self._symbols = symbol_list;
         self.get_valid_characters();
+        self.compile_scanner();
 
     def get_function_names(self):
         """ gets the list of strings of defined functions """
@@ -153,118 +170,89 @@ class Tokenizer():
                 if not isinstance(symbol, str): raise UserError("Symbols must be strings.");
                 elif symbol not in VALID_SYMBOLS: raise UserError("Symbols must be an alphabetic character of length 1.");
 
-    def special_split(self, string, sep="+-"):
-        """ splits the string each time a character in sep is encountered, but not when inside parentheses """
-        p_count, segments, buffer = 0, [], "";
-        for character in string:
-            if character in sep and p_count == 0:
-                if len(buffer) > 0:
-                    segments.append(buffer);
-                    buffer = "";
-                segments.append(character);
-                continue;
-            elif character == "(": p_count += 1;
-            elif character == ")": p_count -= 1;
-            buffer += character;
-        if buffer: segments.append(buffer);
-        return segments;
-
-    def handle_unary_minus(self, string, replacement="~"):
-        """ detects when there is a unary '-' and replaces it with '~' because somebody thought it would be a good idea to use the same symbol for 2 different things """
-        result, last_character = "", string[0];
-
-        if last_character == "-":
-            result += replacement;
-        else:
-            result += last_character;
-
-        for i, character in enumerate(string[1:]):
-            if character == "-":
-                if last_character in "+-*/^(":
-                    result += replacement;
-                else:
-                    result += character;
-            else:
-                result += character;
-            last_character = character;
-        return result;
-
-    def clean(self, string):
-        """ removes whitespace and notational clutter, handles implicit multiplication, locates function names and constants """
-        string = string.replace(" ", "").replace("+-", "-").replace("--", "+");
-
-        new_string = string[0];
-        for i, character in enumerate(string[1:], start=1):
-            if ((character in self._valid_characters+["("]) and (string[i-1] not in OPERATORS+"(,")):
-                new_string += "*" + character;
-            else:
-                new_string += character;
-
-        for name in self._function_names:
-            old = "*".join(list(name)) + "*";
-            new_string = new_string.replace(old, name);
-        for name in sorted(CONSTANTS.keys(), key=lambda name: len(name), reverse=True):
-            old = "*".join(list(name));
-            new_string = new_string.replace(old, name);
-
-        return new_string;
-
-    def test(self, string):
-        """ test the string: parens, illegal characters """
-        pass;
-
-    def get_components(self, string):
-        """ separate the string at each operator, parenthesis, and comma """
-        result, buffer = [], "";
-        for character in string:
-            if character in OPERATORS+"(),":
-                if buffer:
-                    result.append(buffer);
-                    buffer = ""
-                result.append(character);
-            else:
-                buffer += character;
-        if buffer: result.append(buffer);
-        return result;
-
-    def tokenize_term(self, term):
-        """ return a list of tokens from a single term """
-        components, tokens, negates = self.get_components(term), [], 0;
-
-        for component in components:
-            if component in self._function_names:
-                tokens.append(PrefixFunction(component, self._functions[component]));
-            elif component == "~":
-                tokens.append(PrefixFunction("~", OPERATIONS[component]));
-                ###
-                tokens.append(OtherToken("("));
-                negates += 1;
-                ###
-            elif component in OPERATORS:
-                tokens.append(InfixFunction(component, OPERATIONS[component]));
-            elif component.replace(".", "").isdigit():
-                tokens.append(Number(float(component)));
-            elif component in CONSTANTS.keys():
-                tokens.append(Number(CONSTANTS[component]));
-            elif component in self._symbols:
-                tokens.append(Symbol(component));
-            elif component in "(),":
-                tokens.append(OtherToken(component));
-            else:
-                raise UserError("Invalid token '{}'".format(component));
-        ###
-        for i in range(negates):
-            tokens.append(OtherToken(")"));
-        ###
-        return tokens;
-
-    def tokenize(self, expression):
-        """ get tokens from an expression """
+    def compile_scanner(self):
+        """ builds the regular expression that tokenize scans with and the name lookups. called whenever the functions or symbols change """
+        # names are not alternatives of the regular expression, so scanning does not get slower as more functions are defined:
+        # the expression only matches the first character of a name, and the longest name starting there is looked up by
+        # length in dicts (see match_name)
+        starts = "".join(sorted({name[0] for name in self._function_names if not name[0].isalpha() and not name[0].isdigit()}));
+        patterns = [r"(?P<number>\d+(?:\.\d*)?|\.\d+)", r"(?P<name>[^\W\d_]{})".format("|[{}]".format(re.escape(starts)) if starts else "")];
+        patterns.append(r"(?P<operator>[{}])".format(re.escape(OPERATORS)));
+        patterns.append(r"(?P<other>[(){}])".format(re.escape(ARGUMENT_SEPARATOR)));
+        patterns.append(r"(?P<invalid>.)");
+        self._scanner = re.compile("|".join(patterns));
+        self._function_lengths = sorted({len(name) for name in self._function_names}, reverse=True);
+        self._constant_lengths = sorted({len(name) for name in CONSTANTS}, reverse=True);
+        self._symbol_set = set(self._symbols);
+        # the callables are referenced by the tokenizer (and by any tree built with them), so their ids cannot be reused while they are needed
+        self.configuration = (tuple(sorted((name, id(function)) for name, function in self._functions.items())), tuple(self._symbols));
+        self._constant_values = {name: perfect_ratio(value) for name, value in CONSTANTS.items()};
+
+    def match_name(self, string, position):
+        """ the (kind, name) of the longest function name applied to an argument list, constant or symbol at position. None if there is none """
+        for length in self._function_lengths:
+            name = string[position:position + length];
+            if name in self._functions and string.startswith("(", position + length):
+                return "function", name;
+        for length in self._constant_lengths:
+            name = string[position:position + length];
+            if name in CONSTANTS:
+                return "constant", name;
+        if string[position] in self._symbol_set:
+            return "symbol", string[position];
+        return None;
+
+    def normalize(self, expression):
+        """ removes whitespace. token spans refer to positions in the normalized expression """
         if not isinstance(expression, str): raise UserError("Expression must be a string. Actual expression: {}".format(expression));
+        return "".join(expression.split());
 
-        tokens = [];
-        for term in self.special_split(self.handle_unary_minus(self.clean(expression))):
-            tokens += self.tokenize_term(term);
+    def tokenize(self, expression):
+        """ get tokens from an expression in a single pass, inserting implicit multiplication and marking unary minus as '~' """
+        string, tokens = self.normalize(expression), [];
+        operand_ended = False; # whether the last token ends an operand: a number, symbol, constant or ')'
+        position = 0;
+        while position < len(string):
+            match = self._scanner.match(string, position);
+            kind, text, span = match.lastgroup, match.group(), match.span();
+            position = span[1];
+
+            if kind == "name":
+                named = self.match_name(string, span[0]);
+                if named is None:
+                    raise UserError("Invalid token '{}' at position {} of '{}'".format(text, span[0], string));
+                kind, text = named;
+                span = (span[0], span[0] + len(text));
+                position = span[1];
+            elif kind == "number" and string.startswith(".", position):
+                raise UserError("Malformed number '{}' at position {} of '{}'".format(text + ".", span[0], string));
+            elif kind == "operator":
+                if operand_ended and text != "~":
+                    tokens.append(InfixFunction(text, OPERATIONS[text], span));
+                    operand_ended = False;
+                elif text in "-~":
+                    tokens.append(PrefixFunction("~", OPERATIONS["~"], span));
+                elif text != "+": # a unary plus does nothing
+                    raise UserError("Operator '{}' at position {} of '{}' is missing its left operand".format(text, span[0], string));
+                continue;
+            elif kind == "invalid":
+                raise UserError("Invalid token '{}' at position {} of '{}'".format(text, span[0], string));
+
+            starts_operand = kind != "other" or text == "(";
+            if operand_ended and starts_operand:
+                tokens.append(InfixFunction("*", OPERATIONS["*"], (span[0], span[0])));
+
+            if kind == "number":
+                tokens.append(Number(Fraction(text), span));
+            elif kind == "constant":
+                tokens.append(Number(self._constant_values[text], span));
+            elif kind == "symbol":
+                tokens.append(Symbol(text, span));
+            elif kind == "function":
+                tokens.append(PrefixFunction(text, self._functions[text], span));
+            else:
+                tokens.append(OtherToken(text, span));
+            operand_ended = kind in ("number", "constant", "symbol") or text == ")";
         return tokens;
 
 
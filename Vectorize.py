@@ -0,0 +1,125 @@
+import numpy as np;
+from math import prod;
+from functools import reduce;
+from CAS.Errors import UserError;
+from CAS.Compiler import get_ordered_nodes;
+from CAS.data import OPERATIONS, KNOWN_FUNCTIONS;
+
+
+def _log(x, base=None):
+    """ math.log accepts an optional base """
+    return np.log(x) if base is None else np.log(x) / np.log(base);
+
+
+OPERATION_UFUNCS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.true_divide,
+    "%": np.mod,
+    "~": np.negative,
+    "^": np.power
+};
+
+FUNCTION_UFUNCS = {
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "exp": np.exp,
+    "log": _log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "floor": np.floor,
+    "ceil": np.ceil
+};
+
+# operations and functions that are only defined for real numbers
+REAL_ONLY = {"%", "floor", "ceil"};
+
+
+def vectorize_function(function, dtype=float):
+    """ fallback for arbitrary callables: apply element by element, turning evaluation errors into nan """
+    def safe(*arguments):
+        try:
+            return function(*arguments);
+        except (ZeroDivisionError, ValueError, OverflowError):
+            return np.nan;
+    return np.vectorize(safe, otypes=[dtype]);
+
+
+def get_ufunc(node, dtype=float):
+    """ get the array function used to evaluate a tree node """
+    name = getattr(node, "name", None);
+    is_operation = name in OPERATION_UFUNCS and node.function is OPERATIONS[name];
+    if is_operation:
+        known = name;
+    else:
+        try:
+            known = KNOWN_FUNCTIONS.get(node.function);
+        except TypeError: # unhashable callable
+            known = None;
+    if known in REAL_ONLY and np.dtype(dtype).kind == "c":
+        raise UserError("'{}' is not defined for complex numbers".format(known));
+    if is_operation:
+        return OPERATION_UFUNCS[name];
+    if known in FUNCTION_UFUNCS:
+        return FUNCTION_UFUNCS[known];
+    return vectorize_function(node.function, dtype);
+
+
+def batch_evaluate(tree, substitutions, dtype=float, tile_size=None):
+    """ evaluate tree once per node over arrays of substitutions. returns (values, mask) where mask is True for elements that failed to evaluate. with a tile_size, intermediate arrays hold about tile_size elements (see tiled_evaluate) """
+    if tile_size is not None:
+        return tiled_evaluate(tree, substitutions, dtype, tile_size);
+    arrays = {name: np.asarray(value, dtype=dtype) for name, value in substitutions.items()};
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()));
+    values, finite, mask = {}, {}, np.zeros(shape, dtype=bool);
+
+    with np.errstate(all="ignore"):
+        for node in get_ordered_nodes(tree):
+            key = id(node);
+            if node.type == "symbol":
+                if node.value not in arrays:
+                    raise UserError("No value was given for the symbol '{}'".format(node.value));
+                values[key] = arrays[node.value];
+            elif node.type == "number":
+                values[key] = np.asarray(node.value, dtype=dtype);
+            else:
+                arguments = [values[id(subtree)] for subtree in node.subtrees];
+                values[key] = np.asarray(get_ufunc(node, dtype)(*arguments), dtype=dtype);
+                # only count errors introduced at this node: non-finite results from finite arguments
+                arguments_finite = reduce(np.logical_and, [finite[id(subtree)] for subtree in node.subtrees]);
+                mask |= arguments_finite & ~np.isfinite(values[key]);
+            if key not in finite:
+                finite[key] = np.isfinite(values[key]);
+
+    result = np.array(np.broadcast_to(values[id(tree)], shape));
+    result[mask] = np.nan;
+    return result, mask;
+
+
+def tiled_evaluate(tree, substitutions, dtype, tile_size):
+    """ batch_evaluate over tiles of rows of the first axis of the broadcast shape, so peak memory does not grow with the number of rows """
+    if not isinstance(tile_size, int) or tile_size < 1:
+        raise UserError("The tile size must be a positive integer. Actual value: {}".format(tile_size));
+    arrays = {name: np.asarray(value, dtype=dtype) for name, value in substitutions.items()};
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()));
+    if not shape:
+        return batch_evaluate(tree, arrays, dtype);
+    # only arrays that span the first axis are split, the others broadcast against every tile
+    arrays = {name: (array, array.ndim == len(shape) and array.shape[0] != 1) for name, array in arrays.items()};
+    rows = max(1, tile_size // max(1, prod(shape[1:])));
+    result, mask = np.empty(shape, dtype=dtype), np.empty(shape, dtype=bool);
+    for start in range(0, shape[0], rows):
+        tile = {name: array[start:start + rows] if split else array for name, (array, split) in arrays.items()};
+        values, tile_mask = batch_evaluate(tree, tile, dtype);
+        result[start:start + rows], mask[start:start + rows] = values, tile_mask;
+    return result, mask;
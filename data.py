@@ -1,5 +1,7 @@
 from math import pi, e;
 from fractions import Fraction;
+import math;
+import cmath;
 
 CONSTANTS = {
     "pi": pi,
@@ -31,3 +33,38 @@ OPERATORS = "".join(OPERATIONS.keys());
 ARGUMENT_SEPARATOR = ",";
 
 VALID_SYMBOLS = list("abcdfghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ");
+
+# common functions that other evaluation strategies (vectorized, differentiation...) know how to handle, by canonical name
+KNOWN_FUNCTIONS = {
+    math.sin: "sin",
+    math.cos: "cos",
+    math.tan: "tan",
+    math.asin: "asin",
+    math.acos: "acos",
+    math.atan: "atan",
+    math.sinh: "sinh",
+    math.cosh: "cosh",
+    math.tanh: "tanh",
+    math.exp: "exp",
+    math.log: "log",
+    math.log10: "log10",
+    math.log2: "log2",
+    math.sqrt: "sqrt",
+    math.fabs: "abs",
+    math.floor: "floor",
+    math.ceil: "ceil",
+    abs: "abs",
+    cmath.sin: "sin",
+    cmath.cos: "cos",
+    cmath.tan: "tan",
+    cmath.asin: "asin",
+    cmath.acos: "acos",
+    cmath.atan: "atan",
+    cmath.sinh: "sinh",
+    cmath.cosh: "cosh",
+    cmath.tanh: "tanh",
+    cmath.exp: "exp",
+    cmath.log: "log",
+    cmath.log10: "log10",
+    cmath.sqrt: "sqrt",
+};
@@ -1,6 +1,7 @@
 from CAS.Parser import Parser;
 from time import time;
 from math import e, pi, sin, cos;
+from fractions import Fraction;
 
 
 expressions = [
@@ -23,6 +24,86 @@ lambdas = [
 
 tests = list(zip(expressions, lambdas));
 
+# parsing behavior: associativity, unary minus, implicit multiplication and operators after a function's argument list
+behavior_expressions = [
+    "2^3^2",
+    "x^y^z",
+    "8-3-2",
+    "x/y/z",
+    "-x^2",
+    "-2^2",
+    "2^-x",
+    "x--y",
+    "-x*-y",
+    "-(-x)",
+    "3%2*x",
+    "2x(y+1)",
+    "(x+1)(y-1)",
+    "sin(x)cos(y)",
+    "sin(x)^2",
+    "1/x+3",
+    "pi+e*3x^4",
+    "-2-sin(4-xyz/2)"
+];
+
+behavior_lambdas = [
+    lambda x, y, z: 2**3**2,
+    lambda x, y, z: x**y**z,
+    lambda x, y, z: 8-3-2,
+    lambda x, y, z: x/y/z,
+    lambda x, y, z: -x**2,
+    lambda x, y, z: -2**2,
+    lambda x, y, z: 2**-x,
+    lambda x, y, z: x-(-y),
+    lambda x, y, z: (-x)*(-y),
+    lambda x, y, z: x,
+    lambda x, y, z: 3%2*x,
+    lambda x, y, z: 2*x*(y+1),
+    lambda x, y, z: (x+1)*(y-1),
+    lambda x, y, z: sin(x)*cos(y),
+    lambda x, y, z: sin(x**2),
+    lambda x, y, z: 1/x+3,
+    lambda x, y, z: pi+e*3*x**4,
+    lambda x, y, z: -2-sin(4-x*y*z/2)
+];
+
+# (expression, x, y, exact result): results that must stay exact
+exact_results = [
+    ("(x/x)^(1/2)", 2, 1, Fraction(1)),
+    ("(x*y)^(1/2)", Fraction(1, 2), 2, Fraction(1)),
+    ("(x-x)^(1/2)", 3, 1, Fraction(0)),
+    ("(x/y)^(1/2)", 2, 8, Fraction(1, 2)),
+    ("(x/y)^(3/2)", 9, 4, Fraction(27, 8)),
+    ("x/3+y/6", 1, 1, Fraction(1, 2)),
+    ("0.1+0.2", 0, 0, Fraction(3, 10))
+];
+
+def close(a, b):
+    return abs(a - b) <= 1e-12 * max(1.0, abs(b));
+
+def check_behavior(values=((1.5, 2.0, 0.5), (0.3, -1.25, 3.0), (2.0, 3.0, 1.0))):
+    """ compare evaluate, evaluate_exact and the compiled functions with the lambdas, and check exact results. raises AssertionError on the first difference """
+    parser = Parser({"sin": sin, "cos": cos}, ["x", "y", "z"]);
+    checked = 0;
+    for expression, function in zip(behavior_expressions, behavior_lambdas):
+        tree = parser.parse(expression);
+        tree.set_ordered_subs(("x", "y", "z"));
+        compiled = (tree.compile_float(), tree.compile_exact(), tree.compile_complex());
+        for x, y, z in values:
+            expected = function(x, y, z);
+            results = [tree.evaluate(x=x, y=y, z=z), float(tree.evaluate_exact(x=x, y=y, z=z)), tree.complex_evaluate(x=x, y=y, z=z)];
+            results += [float(compiled[0](x, y, z)), float(compiled[1](x, y, z)), compiled[2](x, y, z)];
+            for result in results:
+                assert close(result, expected), "{} at {}: {} != {}".format(expression, (x, y, z), result, expected);
+            checked += 1;
+    for expression, x, y, expected in exact_results:
+        tree = parser.parse(expression);
+        tree.set_ordered_subs(("x", "y"));
+        for result in (tree.evaluate_exact(x=x, y=y), tree.compile_exact()(x, y)):
+            assert type(result) is Fraction and result == expected, "{} at {}: {!r} != {!r}".format(expression, (x, y), result, expected);
+        checked += 1;
+    return checked;
+
 def bench(test, iterations):
     parser_expression, python_expression = test;
     parser = Parser({"sin": sin, "cos": cos}, ["x", "y", "z"]);
@@ -44,3 +125,43 @@ def bench(test, iterations):
     return "Parser time: {}, Python time: {}".format(parser_time, python_time);
 
 
+class DictParseTree():
+    """ a ParseTree node with a __dict__, the layout before nodes had __slots__. only used by bench_memory """
+    def __init__(self, function, subtrees, value, type_="tree"):
+        self.type = type_;
+        if self.type == "tree":
+            self.function = function;
+            self.subtrees = tuple(subtrees);
+            self.name = value;
+        else:
+            self.value = value;
+
+def rebuild(tree, make_node):
+    """ a copy of tree made of make_node nodes, without sharing subtrees """
+    if tree.type == "tree":
+        return make_node(tree.function, [rebuild(subtree, make_node) for subtree in tree.subtrees], tree.name);
+    return make_node(None, None, tree.value, tree.type);
+
+def count_nodes(tree):
+    return 1 + sum(count_nodes(subtree) for subtree in tree.subtrees) if tree.type == "tree" else 1;
+
+def bench_memory(copies=10000):
+    """ bytes per node of the compact node layouts and of the old __dict__ layout, measured with tracemalloc """
+    from tracemalloc import start, stop, take_snapshot;
+    from CAS.Parser import make_node;
+
+    parser = Parser({"sin": sin, "cos": cos}, ["x", "y", "z"]);
+    trees = [parser.parse(expression) for expression in expressions];
+    nodes = copies * sum(count_nodes(tree) for tree in trees);
+
+    results = [];
+    for make in (DictParseTree, make_node):
+        start();
+        before = take_snapshot();
+        kept = [rebuild(tree, make) for i in range(copies) for tree in trees];
+        after = take_snapshot();
+        stop();
+        size = sum(statistic.size_diff for statistic in after.compare_to(before, "filename"));
+        results.append("{}: {:.1f} bytes per node".format(make.__name__, size / nodes));
+        del kept;
+    return ", ".join(results);